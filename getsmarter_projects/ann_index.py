@@ -0,0 +1,222 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# APPROXIMATE NEAREST NEIGHBOUR INDEX
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import abc
+import json
+import pathlib
+import timeit
+import numpy
+import course_similarity
+
+##hnswlib is optional, the IVF index only needs numpy
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+##Default index settings
+IVF_LISTS = 256
+IVF_PROBES = 8
+KMEANS_ITERATIONS = 20
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF = 64
+
+################################################################################################################################################################
+#2.) INDEXES
+
+##Common interface: query unit length vectors, look up words and save to a directory
+##All indexes score by inner product on unit length vectors, i.e. cosine similarity
+##array_names are the arrays saved as .npy files, listed in index.json so loading reads exactly those
+class Index(abc.ABC):
+
+    kind = None
+    array_names = ['vectors']
+
+    def __init__(self, words, vectors):
+        self.words = numpy.asarray(words, dtype=object)
+        self.vectors = vectors
+        self.positions = {word: position for position, word in enumerate(self.words)}
+
+    @abc.abstractmethod
+    def query(self, queries, topn):
+        pass
+
+    ##Most similar words to a word in the index, excluding the word itself
+    def most_similar(self, word, topn=10):
+        position = self.positions[word]
+        ids, scores = self.query(self.vectors[position:position + 1], topn + 1)
+        return [(self.words[i], float(score)) for i, score in zip(ids[0], scores[0]) if i != position and i >= 0][:topn]
+
+    def _arrays(self):
+        return {name: getattr(self, name) for name in self.array_names}
+
+    def _settings(self):
+        return {}
+
+    def save(self, directory):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, array in self._arrays().items():
+            numpy.save(directory / (name + '.npy'), numpy.ascontiguousarray(array))
+        with open(directory / 'index.json', 'w') as file:
+            json.dump({'kind': self.kind,
+                       'settings': self._settings(),
+                       'arrays': list(self._arrays()),
+                       'words': [str(word) for word in self.words]}, file)
+
+##Brute force search over every vector, used as the reference for the benchmark
+class ExactIndex(Index):
+
+    kind = 'exact'
+
+    def query(self, queries, topn):
+        return course_similarity.top_k(numpy.asarray(queries, dtype=numpy.float32) @ self.vectors.T, topn)
+
+##Inverted file index: vectors are bucketed by their nearest k-means centroid and a query only scans the nprobe closest buckets
+##Bucket members are stored as one id array with offsets, like the course corpus
+class IVFIndex(Index):
+
+    kind = 'ivf'
+    array_names = ['vectors', 'centroids', 'list_ids', 'list_offsets']
+
+    def __init__(self, words, vectors, centroids, list_ids, list_offsets, nprobe=IVF_PROBES):
+        super().__init__(words, vectors)
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, words, vectors, nlist=IVF_LISTS, nprobe=IVF_PROBES, iterations=KMEANS_ITERATIONS, random_state=23):
+        nlist = max(1, min(nlist, len(vectors)))
+        rng = numpy.random.default_rng(random_state)
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = numpy.argmax(vectors @ centroids.T, axis=1)
+            sums = numpy.zeros_like(centroids)
+            numpy.add.at(sums, assignment, vectors)
+            norms = numpy.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            centroids[~empty] = sums[~empty] / norms[~empty]
+        assignment = numpy.argmax(vectors @ centroids.T, axis=1)
+        list_ids = numpy.argsort(assignment, kind='stable').astype(numpy.int32)
+        list_offsets = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(assignment, minlength=nlist))]).astype(numpy.int64)
+        return cls(words, vectors, centroids.astype(numpy.float32), list_ids, list_offsets, nprobe)
+
+    def query(self, queries, topn):
+        queries = numpy.asarray(queries, dtype=numpy.float32)
+        probes, _ = course_similarity.top_k(queries @ self.centroids.T, self.nprobe)
+        ids = numpy.full((len(queries), topn), -1, dtype=numpy.int64)
+        scores = numpy.full((len(queries), topn), -numpy.inf, dtype=numpy.float32)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = numpy.concatenate([self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+            if len(candidates) == 0:
+                continue
+            best, best_scores = course_similarity.top_k((self.vectors[candidates] @ query)[None, :], topn)
+            ids[row, :best.shape[1]] = candidates[best[0]]
+            scores[row, :best.shape[1]] = best_scores[0]
+        return ids, scores
+
+    def _settings(self):
+        return {'nprobe': self.nprobe}
+
+##Hierarchical navigable small world graph from hnswlib, when it is installed
+class HnswIndex(Index):
+
+    kind = 'hnsw'
+
+    def __init__(self, words, vectors, graph, ef=HNSW_EF):
+        super().__init__(words, vectors)
+        self.graph = graph
+        self.graph.set_ef(ef)
+        self.ef = ef
+
+    @classmethod
+    def build(cls, words, vectors, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef=HNSW_EF):
+        if hnswlib is None:
+            raise ImportError('hnswlib is required for the hnsw index')
+        graph = hnswlib.Index(space='ip', dim=vectors.shape[1])
+        graph.init_index(max_elements=len(vectors), M=m, ef_construction=ef_construction)
+        graph.add_items(vectors, numpy.arange(len(vectors)))
+        return cls(words, vectors, graph, ef)
+
+    def query(self, queries, topn):
+        self.graph.set_ef(max(self.ef, topn))
+        ids, distances = self.graph.knn_query(numpy.asarray(queries, dtype=numpy.float32), k=topn)
+        return ids.astype(numpy.int64), 1 - distances
+
+    def save(self, directory):
+        super().save(directory)
+        self.graph.save_index(str(pathlib.Path(directory) / 'graph.bin'))
+
+    def _settings(self):
+        return {'ef': self.ef}
+
+################################################################################################################################################################
+#3.) BUILD AND LOAD
+
+##Build an index of the given kind from a gensim KeyedVectors
+def build_index(wv, kind='ivf', **params):
+    words, vectors = course_similarity.normalised_vectors(wv)
+    if kind == 'exact':
+        return ExactIndex(words, vectors)
+    if kind == 'ivf':
+        return IVFIndex.build(words, vectors, **params)
+    if kind == 'hnsw':
+        return HnswIndex.build(words, vectors, **params)
+    raise ValueError('Unknown index kind: {}'.format(kind))
+
+##Index classes by kind
+INDEX_KINDS = {index_class.kind: index_class for index_class in [ExactIndex, IVFIndex, HnswIndex]}
+
+##Load a saved index with its arrays memory-mapped
+##Only the arrays listed in index.json are read, so arrays left by an earlier index of another kind are ignored
+def load_index(directory, mmap_mode='r'):
+    directory = pathlib.Path(directory)
+    with open(directory / 'index.json') as file:
+        metadata = json.load(file)
+    if metadata['kind'] not in INDEX_KINDS:
+        raise ValueError('Unknown index kind: {}'.format(metadata['kind']))
+    names = metadata.get('arrays', INDEX_KINDS[metadata['kind']].array_names)
+    arrays = {name: numpy.load(directory / (name + '.npy'), mmap_mode=mmap_mode) for name in names}
+    if metadata['kind'] == 'exact':
+        return ExactIndex(metadata['words'], arrays['vectors'])
+    if metadata['kind'] == 'ivf':
+        return IVFIndex(metadata['words'], arrays['vectors'], arrays['centroids'], arrays['list_ids'], arrays['list_offsets'],
+                        **metadata['settings'])
+    if metadata['kind'] == 'hnsw':
+        if hnswlib is None:
+            raise ImportError('hnswlib is required for the hnsw index')
+        graph = hnswlib.Index(space='ip', dim=arrays['vectors'].shape[1])
+        graph.load_index(str(directory / 'graph.bin'), max_elements=len(arrays['vectors']))
+        return HnswIndex(metadata['words'], arrays['vectors'], graph, **metadata['settings'])
+
+################################################################################################################################################################
+#4.) BENCHMARK
+
+##Recall@topn and per query latency of an index against exact search, over a random sample of indexed vectors
+def benchmark(index, topn=10, number_of_queries=1000, random_state=23):
+    exact = ExactIndex(index.words, index.vectors)
+    rng = numpy.random.default_rng(random_state)
+    rows = rng.choice(len(index.vectors), min(number_of_queries, len(index.vectors)), replace=False)
+    queries = numpy.asarray(index.vectors[rows], dtype=numpy.float32)
+    expected, _ = exact.query(queries, topn)
+    latencies = []
+    found = 0
+    for query, truth in zip(queries, expected):
+        start = timeit.default_timer()
+        ids, _ = index.query(query[None, :], topn)
+        latencies.append(timeit.default_timer() - start)
+        found += len(numpy.intersect1d(ids[0], truth))
+    latencies = numpy.array(latencies) * 1000
+    return {'kind': index.kind,
+            'recall': found / (len(queries) * expected.shape[1]),
+            'mean_latency_ms': float(latencies.mean()),
+            'p99_latency_ms': float(numpy.percentile(latencies, 99))}
@@ -0,0 +1,36 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COLUMN PROJECTION
+
+################################################################################################################################################################
+#1.) SQL CLAUSES
+
+##SELECT list of the required columns, expressions maps every output column name to its SQL expression in output order
+def select_clause(expressions, columns, separator=',\n       '):
+    items = []
+    for name, expression in expressions.items():
+        if name not in columns:
+            continue
+        items.append(expression if expression.split('.')[-1] == name else '{} AS {}'.format(expression, name))
+    return separator.join(items)
+
+##GROUP BY list of the grain keys plus any required columns that are not keys themselves
+##Required columns must be functionally dependent on the keys, so the grain and the aggregates do not change
+def group_by_clause(keys, expressions, columns, separator=',\n         '):
+    items = list(keys)
+    for name, expression in expressions.items():
+        if name in columns and expression not in items:
+            items.append(expression)
+    return separator.join(items)
+
+################################################################################################################################################################
+#2.) REQUIRED COLUMNS
+
+##Columns read by the stages that will run, in the order of the expressions
+##columns_by_stage maps a stage name to the columns it reads, stages that are not listed read none
+def required_columns(expressions, columns_by_stage, stages):
+    required = set()
+    for stage in stages:
+        required.update(columns_by_stage.get(stage, []))
+    return [name for name in expressions if name in required]
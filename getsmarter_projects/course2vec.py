@@ -7,31 +7,31 @@
 #1.) SETUP
 
 ##Import libraries
-import psycopg2
-import configparser
-import pathlib
 import pandas
-import numpy
-import warnings
-import timeit
-import gensim.models
+import pathlib
 import plotly.express
-from sklearn.manifold import TSNE
-
-##Connect config file
-config = configparser.ConfigParser()
-config_file = str(pathlib.Path.home())+'/config.ini'
-config.read(config_file)
+import extract_cache
+import extract_schema
+import course_sentences
+import course2vec_training
+import course_index as course_index_module
+import course_similarity
+import ann_index
+import course_projection
+import embedding_export
+import entity_embeddings
+
+##Output locations
+CORPUS_DIR = pathlib.Path.home() / 'course2vec' / 'corpus'
+MODEL_DIR = pathlib.Path.home() / 'course2vec' / 'model'
+INDEX_DIR = pathlib.Path.home() / 'course2vec' / 'index'
+EXPORT_DIR = pathlib.Path.home() / 'course2vec' / 'export'
+ENTITY_CORPUS_DIR = pathlib.Path.home() / 'course2vec' / 'entity_corpus'
+ENTITY_MODEL_DIR = pathlib.Path.home() / 'course2vec' / 'entity_model'
 
 ################################################################################################################################################################
 #2.) EXTRACT DATA
 
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
-
 ##Course Table
 ##Sql query
 sql = """
@@ -44,98 +44,124 @@ FROM rdw_bcd.vw_bcd_opportunity A
 LEFT JOIN rdw_bcd.vw_bcd_presentation B ON B.presentation_code = A.presentation_code
 """
 
+##Column types
+df_course_schema = {'course_code': 'category',
+                    'course_abbreviation': 'category',
+                    'course': 'category',
+                    'university_abbreviation': 'category',
+                    'university': 'category'}
+
 ##Create pandas dataframe
-df_course = pandas.read_sql_query(sql, rdw_conn)
+df_course = extract_cache.read_sql(sql, name='df_course', schema=df_course_schema)
 
 ##Edit course table
 ##Remove NaN's
 df_course = df_course.dropna()
 
 ##Transform floats to integers
-df_course['course_code'] = 'A' + df_course['course_code'].astype(str)
+df_course['course_code'] = extract_schema.prefix_codes(df_course['course_code'], 'A')
 
 ##View data
 print(df_course)
 
 ##Opportunity Table
+##Only people with opportunities newer than the saved model's watermark are pulled, with their full history
+model_state = course2vec_training.load_state(MODEL_DIR)
+watermark = model_state['watermark'] if model_state is not None else '1900-01-01'
+print('Training watermark:', watermark)
+
 ##Sql query
 sql = """
-SELECT person_code,
-       B.course_code
+SELECT A.person_code,
+       B.course_code,
+       A.created_date
 FROM rdw_bcd.vw_bcd_opportunity A
 LEFT JOIN rdw_bcd.vw_bcd_presentation B ON B.presentation_code = A.presentation_code
+WHERE A.person_code IN (SELECT person_code
+                        FROM rdw_bcd.vw_bcd_opportunity
+                        WHERE created_date > %(watermark)s)
 """
 
+##Column types
+df_opportunity_schema = {'person_code': 'category',
+                         'course_code': 'category'}
+
 ##Create pandas dataframe
-df_opportunity = pandas.read_sql_query(sql, rdw_conn)
+df_opportunity = extract_cache.read_sql(sql, params={'watermark': watermark}, name='df_opportunity', schema=df_opportunity_schema)
 
 ##Edit opportunity table
 ##Remove NaN's
-df_opportunity = df_opportunity.dropna()
+df_opportunity = df_opportunity.dropna(subset=['person_code', 'course_code'])
+new_watermark = df_opportunity['created_date'].max() if len(df_opportunity) else watermark
 
 ##Transform floats to integers
-df_opportunity['person_code'] = 'A' + df_opportunity['person_code'].astype(str)
-df_opportunity['course_code'] = 'A' + df_opportunity['course_code'].astype(str)
+df_opportunity['person_code'] = extract_schema.prefix_codes(df_opportunity['person_code'], 'A')
+df_opportunity['course_code'] = extract_schema.prefix_codes(df_opportunity['course_code'], 'A')
 
 ##View data
 print(df_opportunity)
 
+##Opportunities per course code newer than the watermark, the only ones the saved model has not counted yet
+new_opportunities = pandas.to_datetime(df_opportunity['created_date']) > pandas.Timestamp(watermark)
+new_course_counts = df_opportunity.loc[new_opportunities, 'course_code'].astype(str).value_counts().to_dict()
+
 ################################################################################################################################################################
 #3.) MODELLING
 
 ##Model Input
-##Create a list
-course_list = df_opportunity.sort_values(['person_code', 'course_code'])[['person_code', 'course_code']].values.tolist()
-
 ##Create product corpus
-course_corpus = []
-sentence = []
-new_person_code = course_list[0][0]
-for (person_code, course_code) in course_list:
-    if new_person_code != person_code:
-        course_corpus.append(sentence)
-        sentence = []
-        new_person_code = person_code
-    sentence.append(str(course_code))
+##One sentence per person of their course codes, held as an int32 token array with sentence offsets
+course_corpus = course_sentences.build_corpus(df_opportunity, 'person_code', 'course_code')
+print('Number of sentences:', len(course_corpus))
+
+##Merge the new sentences into the saved corpus and stream the full corpus back from disk
+##People in this extract replace their earlier sentence, so the saved corpus always covers everyone
+##Training reads the memory-mapped token arrays directly, no text copy of the corpus is written
+new_sentences = len(course_corpus)
+course_corpus = course_sentences.update_corpus(CORPUS_DIR, course_corpus)
+print('Number of sentences in saved corpus:', len(course_corpus))
 
 ##Train word2vec model
-start = timeit.default_timer()
-model = gensim.models.Word2Vec(course_corpus, window=2, size=100, workers=4, min_count=10, sg=1)
-stop = timeit.default_timer()
-print('Time: ', stop - start)
+##Continues from the saved model on the new sentences when there is one, otherwise trains from scratch on the full corpus
+model = course2vec_training.train_or_update(course_corpus, MODEL_DIR, new_watermark, new_sentences, new_course_counts)
+
+##Course metadata index built once and shared by the lookups below
+course_index = course_index_module.CourseIndex(df_course)
 
 ##Function to return product description rather than product code
 def toCourseName(id):
-    return df_course[df_course['course_code'] == id]['course_abbreviation'].values.tolist()[0]
+    return course_index.abbreviation(id)
 
 ##Function to create similarity list using cosine similarity
 def most_similar_readable(model, course_code):
     similar_list = [(course_code, 1.0)] + model.wv.most_similar(course_code)
     return [(toCourseName((id)), similarity ) for (id, similarity) in similar_list]
 
-#df_course[df_course['course_code'] == id]['course_abbreviation'].values.tolist()[0]
-
 pandas.DataFrame(most_similar_readable(model, 'A1.0'), columns=['course', 'similarity'])
 
-##T-SNE dimension reduction
-labels = []
-tokens = []
+##Similarity table for every course in one batch
+df_course_similarity = course_similarity.batch_most_similar(model.wv, topn=10, course_index=course_index)
+df_course_similarity.to_csv(MODEL_DIR / 'course_similarity.csv', index=False)
+print(df_course_similarity.head(20))
 
-for word in model.wv.vocab:
-    tokens.append(model[word])
-    labels.append(df_course['course_abbreviation'][df_course['course_code'] == word].to_string(index=False))
+##Approximate nearest neighbour index for request time lookups
+course_ann_index = ann_index.build_index(model.wv, kind='ivf')
+course_ann_index.save(INDEX_DIR)
+print(ann_index.benchmark(course_ann_index))
+print(ann_index.benchmark(ann_index.build_index(model.wv, kind='exact')))
 
-tsne_model = TSNE(perplexity=40, n_components=2, init='pca', n_iter=500, random_state=23)
-new_values = tsne_model.fit_transform(tokens)
+##Compact embedding export for downstream services, with the recall cost of each quantization
+embedding_export.export(model.wv, EXPORT_DIR, quantization='float16')
+print(pandas.DataFrame(embedding_export.benchmark(model.wv, EXPORT_DIR / 'benchmark')))
 
-##Add x and y co-ordinates to dataframe
-#df_tsne_coordinates['course_abbreviation'] = pandas.DataFrame({'course_abbreviation':labels, 'x':new_values[:,0], 'y':new_values[:,1]})
-#df_tsne_coordinates
+##T-SNE dimension reduction
+##Coordinates are computed from the contiguous embedding matrix and cached by model version
+words, new_values = course_projection.cached_projection(model.wv, method='fft')
 
 ##Add x and y co-ordinates to dataframe
-df_tsne_coordinates = pandas.DataFrame({'course_abbreviation':labels, 'x':new_values[:,0], 'y':new_values[:,1]})
-df_tsne_coordinates['course_abbreviation'] = df_tsne_coordinates['course_abbreviation'].str.strip()
-df_course_tsne = pandas.merge(left=df_course, right=df_tsne_coordinates, how='inner', on='course_abbreviation')
+##Labels come from the course index, with every abbreviation of a duplicated course code in course_abbreviations
+df_tsne_coordinates = pandas.DataFrame({'course_code':words, 'x':new_values[:,0], 'y':new_values[:,1]})
+df_course_tsne = pandas.merge(left=course_index.lookup(words), right=df_tsne_coordinates, how='inner', on='course_code')
 df_course_tsne.head(10)
 
 plotly.express.scatter(data_frame=df_course_tsne,
@@ -150,3 +176,56 @@ plotly.express.scatter(data_frame=df_course_tsne,
 
 df_course_tsne[df_course_tsne['course_abbreviation'] == 'CAM-BSM']
 pandas.DataFrame(most_similar_readable(model, 'A233.0'), columns=['course', 'similarity'])
+
+
+################################################################################################################################################################
+#4.) MULTI-ENTITY EMBEDDINGS
+
+##Course, presentation and module tokens of every person, embedded in one space
+##Modules are identified by their LMS instance and course module id, and only modules with student activity are included
+##Sql query
+sql = """
+SELECT DISTINCT B.person_code,
+                C.course_code,
+                A.presentation_code,
+                CASE WHEN E.course_module_id IS NOT NULL THEN CONCAT(E.la_university, ':', E.course_module_id) END AS module_code
+FROM rdw_bcd.vw_bcd_enrolment A
+LEFT JOIN rdw_bcd.vw_bcd_registration B ON B.registration_id = A.registration_id
+LEFT JOIN rdw_bcd.vw_bcd_presentation C ON C.presentation_code = A.presentation_code
+LEFT JOIN rdw_bcd.vw_bcd_partner D ON D.vle_credential_id = C.vle_credential_id
+                                   AND D.university_code = C.university_code
+LEFT JOIN (SELECT DISTINCT university AS la_university,
+                           course_id AS vle_course_id,
+                           user_id AS vle_user_id,
+                           course_module_id
+           FROM rdw_la.vw_master_alluser_activities
+           WHERE user_role = 'student') E ON E.la_university = D.la_university
+                                          AND E.vle_course_id = A.vle_course_id
+                                          AND E.vle_user_id = A.vle_user_id
+WHERE A.vle_user_id IS NOT NULL
+"""
+
+##Column types
+df_entity_activity_schema = {'person_code': 'category',
+                             'course_code': 'category',
+                             'presentation_code': 'category',
+                             'module_code': 'category'}
+
+##Create pandas dataframe
+df_entity_activity = extract_cache.read_sql(sql, name='df_entity_activity', schema=df_entity_activity_schema)
+
+##Edit entity table
+##Remove NaN's, a missing module only means the person has no recorded activity
+df_entity_activity = df_entity_activity.dropna(subset=['person_code', 'course_code'])
+
+##Transform floats to integers
+df_entity_activity['person_code'] = extract_schema.prefix_codes(df_entity_activity['person_code'], 'A')
+df_entity_activity['course_code'] = extract_schema.prefix_codes(df_entity_activity['course_code'], 'A')
+
+##One sentence per person of typed tokens, each course followed by its presentations and modules
+entity_corpus = course_sentences.build_corpus(entity_embeddings.entity_tokens(df_entity_activity), 'person_code', 'token', order_column='course_order')
+print('Number of entity sentences:', len(entity_corpus), 'vocabulary:', len(entity_corpus.vocabulary))
+
+##Train the joint model on the pruned compact corpus
+entity_model = entity_embeddings.train(entity_corpus, ENTITY_CORPUS_DIR, ENTITY_MODEL_DIR)
+entity_model.wv.most_similar('C:A1.0')
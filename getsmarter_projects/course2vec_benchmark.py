@@ -0,0 +1,175 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COURSE2VEC BENCHMARK
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import argparse
+import itertools
+import multiprocessing
+import pathlib
+import queue
+import resource
+import sys
+import tempfile
+import timeit
+import numpy
+import pandas
+import gensim.models
+import course_sentences
+import course_similarity
+
+##Benchmark settings
+BENCHMARK_DIR = pathlib.Path.home() / 'course2vec' / 'benchmark'
+HIT_RATE_TOPN = 10
+MIN_COUNT = 10
+
+##A run that has not reported after this many seconds is stopped and recorded as failed
+RUN_TIMEOUT_SECONDS = 4 * 60 * 60
+POLL_SECONDS = 5
+
+##Default sweep, every combination is trained once
+SWEEP = {'workers': [1, 4, 8, 16, 32],
+         'size': [50, 100, 200],
+         'window': [2, 5],
+         'negative': [5, 15],
+         'iter': [5, 10]}
+
+################################################################################################################################################################
+#2.) CORPORA
+
+##Synthetic corpus of people taking courses from a few related clusters of courses, with skewed course popularity
+def synthetic_corpus(number_of_people=200000, number_of_courses=2000, number_of_clusters=50, random_state=23):
+    rng = numpy.random.default_rng(random_state)
+    lengths = numpy.minimum(rng.geometric(0.4, number_of_people) + 1, 20)
+    offsets = numpy.concatenate([[0], numpy.cumsum(lengths)]).astype(numpy.int64)
+    clusters = numpy.repeat(rng.integers(0, number_of_clusters, number_of_people), lengths)
+    cluster_size = number_of_courses // number_of_clusters
+    within_cluster = numpy.minimum(rng.zipf(1.5, offsets[-1]) - 1, cluster_size - 1)
+    tokens = (clusters * cluster_size + within_cluster).astype(numpy.int32)
+    vocabulary = numpy.asarray(['A{}'.format(course) for course in range(number_of_courses)], dtype=object)
+    return course_sentences.CourseCorpus(tokens, offsets, vocabulary)
+
+##Hold out one course of every person with at least two courses
+##Returns the training corpus and the held out (remaining courses, held out course) pairs
+def hold_out(corpus, random_state=23):
+    rng = numpy.random.default_rng(random_state)
+    lengths = numpy.diff(corpus.offsets)
+    held_out = numpy.full(len(corpus), -1, dtype=numpy.int64)
+    eligible = numpy.flatnonzero(lengths >= 2)
+    held_out[eligible] = corpus.offsets[eligible] + rng.integers(0, lengths[eligible])
+    keep = numpy.ones(corpus.offsets[-1] - corpus.offsets[0], dtype=bool)
+    keep[held_out[eligible] - corpus.offsets[0]] = False
+    tokens = numpy.asarray(corpus.tokens[corpus.offsets[0]:corpus.offsets[-1]])[keep]
+    offsets = numpy.concatenate([[0], numpy.cumsum(lengths - (held_out >= 0))]).astype(numpy.int64)
+    train = course_sentences.CourseCorpus(tokens, offsets, corpus.vocabulary)
+    targets = corpus.tokens[held_out[eligible]]
+    return train, eligible, targets
+
+################################################################################################################################################################
+#3.) SINGLE RUN
+
+##Share of held out courses found in the top-k neighbours of the mean vector of each person's other courses
+def held_out_hit_rate(wv, train, people, targets, topn=HIT_RATE_TOPN, max_people=20000):
+    words, vectors = course_similarity.normalised_vectors(wv)
+    positions = pandas.Index(words)
+    hits = 0
+    evaluated = 0
+    for person, target in zip(people[:max_people], targets[:max_people]):
+        rows = positions.get_indexer(train.sentence(person))
+        rows = rows[rows >= 0]
+        target_row = positions.get_indexer([train.vocabulary[target]])[0]
+        if len(rows) == 0 or target_row < 0:
+            continue
+        scores = vectors @ vectors[rows].mean(axis=0)
+        scores[rows] = -numpy.inf
+        ids, _ = course_similarity.top_k(scores[None, :], topn)
+        hits += target_row in ids[0]
+        evaluated += 1
+    return hits / evaluated if evaluated else numpy.nan
+
+##Peak resident memory of this process in megabytes
+def peak_rss_megabytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+##Train one configuration in its own process so peak memory is measured per run
+##train_file is the line sentence file of the training corpus written by sweep
+def _run(corpus_dir, train_file, params, result_queue):
+    corpus = course_sentences.load_corpus(corpus_dir)
+    train, people, targets = hold_out(corpus)
+    start = timeit.default_timer()
+    model = gensim.models.Word2Vec(corpus_file=str(train_file), min_count=MIN_COUNT, sg=1, **params)
+    wall_time = timeit.default_timer() - start
+    result_queue.put(dict(params,
+                          wall_time=wall_time,
+                          words_per_second=train.number_of_words() * params['iter'] / wall_time,
+                          peak_rss_mb=peak_rss_megabytes(),
+                          hit_rate=held_out_hit_rate(model.wv, train, people, targets)))
+
+################################################################################################################################################################
+#4.) SWEEP
+
+##Wait for a run's result, or None when its process exits without one (a crash or an out of memory kill) or times out
+def _wait_for_result(process, result_queue, timeout=RUN_TIMEOUT_SECONDS):
+    start = timeit.default_timer()
+    while True:
+        try:
+            return result_queue.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            ##The result may have arrived just before the process exited
+            try:
+                return result_queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                return None
+        if timeit.default_timer() - start > timeout:
+            process.terminate()
+            return None
+
+##Train every combination of the sweep on a saved corpus and return one row of measurements per run
+##Runs that fail are recorded with their exit code, the other measurements left empty
+##The training sentences are written to a temporary directory under BENCHMARK_DIR, never next to the saved corpus
+def sweep(corpus_dir, grid=SWEEP, output_path=None, timeout=RUN_TIMEOUT_SECONDS):
+    corpus = course_sentences.load_corpus(corpus_dir)
+    train, _, _ = hold_out(corpus)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=BENCHMARK_DIR) as temp_dir:
+        train_file = pathlib.Path(temp_dir) / 'train.txt'
+        train.write_line_sentence(train_file)
+        for values in itertools.product(*grid.values()):
+            params = dict(zip(grid.keys(), values))
+            result_queue = context.Queue()
+            process = context.Process(target=_run, args=(corpus_dir, train_file, params, result_queue))
+            process.start()
+            result = _wait_for_result(process, result_queue, timeout)
+            process.join()
+            if result is None:
+                result = dict(params, failed=True, exitcode=process.exitcode)
+            print(result)
+            results.append(result)
+    df_results = pandas.DataFrame(results)
+    if output_path is not None:
+        df_results.to_csv(output_path, index=False)
+    return df_results
+
+################################################################################################################################################################
+#5.) COMMAND LINE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Course2vec training benchmark')
+    parser.add_argument('--corpus-dir', help='saved corpus from course2vec.py, a synthetic corpus is generated when omitted')
+    parser.add_argument('--output', default=str(BENCHMARK_DIR / 'results.csv'))
+    args = parser.parse_args()
+    corpus_dir = args.corpus_dir
+    if corpus_dir is None:
+        corpus_dir = BENCHMARK_DIR / 'synthetic_corpus'
+        synthetic_corpus().save(corpus_dir)
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    print(sweep(corpus_dir, output_path=args.output))
@@ -0,0 +1,231 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COURSE2VEC SIMILARITY SERVICE
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import http.client
+import json
+import os
+import pathlib
+import signal
+import socket
+import sys
+import timeit
+import urllib.parse
+import numpy
+import ann_index
+
+##Service settings
+INDEX_DIR = pathlib.Path.home() / 'course2vec' / 'index'
+HOST = '127.0.0.1'
+PORT = 8080
+WORKERS = os.cpu_count()
+CACHE_SIZE = 10000
+DEFAULT_TOPN = 10
+
+##Largest topn a client may ask for, larger values are rejected so queries and cache keys stay bounded
+MAX_TOPN = 100
+
+################################################################################################################################################################
+#2.) QUERIES
+
+##Index loaded once per worker, memory-mapped so every worker shares the same pages
+_index = None
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = ann_index.load_index(INDEX_DIR)
+    return _index
+
+##Most similar courses to one course code
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def most_similar(course_code, topn=DEFAULT_TOPN):
+    index = get_index()
+    if course_code not in index.positions:
+        return {'course_code': course_code, 'error': 'unknown course code'}
+    return {'course_code': course_code,
+            'similar': [{'course_code': word, 'similarity': score} for word, score in index.most_similar(course_code, topn)]}
+
+##Recommendations for a person from the mean vector of the courses they have taken, excluding those courses
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def recommend(course_history, topn=DEFAULT_TOPN):
+    index = get_index()
+    positions = [index.positions[code] for code in course_history if code in index.positions]
+    if not positions:
+        return {'course_history': list(course_history), 'error': 'no known course codes'}
+    person_vector = numpy.asarray(index.vectors[positions], dtype=numpy.float32).mean(axis=0)
+    person_vector /= max(numpy.linalg.norm(person_vector), numpy.finfo(numpy.float32).tiny)
+    ids, scores = index.query(person_vector[None, :], topn + len(positions))
+    taken = set(positions)
+    recommendations = [{'course_code': index.words[i], 'similarity': float(score)}
+                       for i, score in zip(ids[0], scores[0]) if i >= 0 and i not in taken][:topn]
+    return {'course_history': list(course_history), 'recommendations': recommendations}
+
+##Course codes of a request body, which must be a list of strings
+def _course_codes(body):
+    codes = body['course_codes']
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        raise TypeError('course_codes must be a list of strings')
+    return codes
+
+##Status of a single query result, 404 when none of its course codes are known
+def _status(result):
+    return 404 if 'error' in result else 200
+
+##Route a request to its query, returning a status code and a JSON serialisable body
+##Malformed input raises KeyError, ValueError or TypeError, answered with a 400
+##A batch answers 200 with an error entry for each unknown course code, the other codes still have results
+def handle(method, path, query, body):
+    topn = int(query.get('topn', [body.get('topn', DEFAULT_TOPN)])[0])
+    if not 1 <= topn <= MAX_TOPN:
+        raise ValueError('topn must be between 1 and {}'.format(MAX_TOPN))
+    if method == 'GET' and path == '/health':
+        return 200, {'status': 'ok', 'vocabulary_size': len(get_index().words)}
+    if method == 'GET' and path == '/similar':
+        result = most_similar(query['course_code'][0], topn)
+        return _status(result), result
+    if method == 'POST' and path == '/similar/batch':
+        return 200, {'results': [most_similar(code, topn) for code in _course_codes(body)]}
+    if method == 'POST' and path == '/recommend':
+        result = recommend(tuple(sorted(set(_course_codes(body)))), topn)
+        return _status(result), result
+    return 404, {'error': 'not found'}
+
+################################################################################################################################################################
+#3.) HTTP SERVER
+
+##Request body as a dict, empty when there is no body
+def _parse_body(raw_body):
+    body = json.loads(raw_body) if raw_body else {}
+    if not isinstance(body, dict):
+        raise ValueError('request body must be a JSON object')
+    return body
+
+##Write one JSON response
+async def _respond(writer, status, payload):
+    response = json.dumps(payload).encode('utf-8')
+    writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+                 .format(status, http.client.responses[status], len(response)).encode('latin-1') + response)
+    await writer.drain()
+
+##Minimal HTTP/1.1 handler with keep-alive, enough for JSON queries from internal clients
+##Queries run on the default thread pool so the numpy work never blocks the event loop
+async def _serve_connection(reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                raw_body = await reader.readexactly(int(headers.get('content-length', 0)))
+            except ValueError as error:
+                ##A request that cannot be framed leaves the rest of the stream unreadable, answer it and close
+                await _respond(writer, 400, {'error': 'malformed request: {}'.format(error)})
+                break
+            url = urllib.parse.urlsplit(target)
+            try:
+                status, payload = await loop.run_in_executor(None, handle, method, url.path, urllib.parse.parse_qs(url.query), _parse_body(raw_body))
+            except (KeyError, ValueError, TypeError) as error:
+                status, payload = 400, {'error': str(error)}
+            except Exception as error:
+                status, payload = 500, {'error': str(error)}
+            await _respond(writer, status, payload)
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+##Run one worker's event loop on the shared listening socket
+def _run_worker(listening_socket):
+    get_index()
+    async def main():
+        server = await asyncio.start_server(_serve_connection, sock=listening_socket)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+##Bind once and fork worker processes that all accept on the same socket
+def serve(host=HOST, port=PORT, workers=WORKERS):
+    listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listening_socket.bind((host, port))
+    listening_socket.listen(1024)
+    listening_socket.setblocking(False)
+    print('Serving course2vec on http://{}:{} with {} workers'.format(host, port, workers))
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(listening_socket)
+            os._exit(0)
+        children.append(pid)
+    ##Stopping the parent also stops the forked workers
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        _run_worker(listening_socket)
+    finally:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+################################################################################################################################################################
+#4.) LOAD TEST
+
+##Send requests from concurrent keep-alive clients and report latency percentiles in milliseconds
+def load_test(course_codes, host=HOST, port=PORT, concurrency=32, number_of_requests=10000, topn=DEFAULT_TOPN):
+    def client(client_number):
+        connection = http.client.HTTPConnection(host, port)
+        latencies = []
+        for request_number in range(client_number, number_of_requests, concurrency):
+            code = urllib.parse.quote(course_codes[request_number % len(course_codes)])
+            start = timeit.default_timer()
+            connection.request('GET', '/similar?course_code={}&topn={}'.format(code, topn))
+            connection.getresponse().read()
+            latencies.append(timeit.default_timer() - start)
+        connection.close()
+        return latencies
+    start = timeit.default_timer()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = numpy.concatenate([numpy.array(result) for result in executor.map(client, range(concurrency))]) * 1000
+    elapsed = timeit.default_timer() - start
+    return {'requests': len(latencies),
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': float(numpy.percentile(latencies, 50)),
+            'p95_ms': float(numpy.percentile(latencies, 95)),
+            'p99_ms': float(numpy.percentile(latencies, 99))}
+
+################################################################################################################################################################
+#5.) COMMAND LINE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Course2vec similarity service')
+    parser.add_argument('command', choices=['serve', 'load-test'])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args.host, args.port, args.workers)
+    else:
+        print(load_test(list(get_index().words), args.host, args.port, args.concurrency, args.requests))
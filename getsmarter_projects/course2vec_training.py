@@ -0,0 +1,84 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COURSE2VEC TRAINING
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import json
+import pathlib
+import timeit
+import gensim.models
+
+##Default model settings
+MODEL_PARAMS = {'window': 2, 'size': 100, 'workers': 4, 'min_count': 10, 'sg': 1}
+
+##Opportunity column used as the incremental training watermark
+WATERMARK_COLUMN = 'created_date'
+
+################################################################################################################################################################
+#2.) MODEL STATE
+
+##Location of the saved model and of its training state
+def model_path(model_dir):
+    return pathlib.Path(model_dir) / 'course2vec.model'
+
+def state_path(model_dir):
+    return pathlib.Path(model_dir) / 'course2vec_state.json'
+
+##Training state of the saved model, or None when no model has been trained yet
+def load_state(model_dir):
+    if not model_path(model_dir).exists() or not state_path(model_dir).exists():
+        return None
+    with open(state_path(model_dir)) as file:
+        return json.load(file)
+
+##Save the model and the watermark of the last opportunity it was trained on
+def save(model, model_dir, watermark):
+    pathlib.Path(model_dir).mkdir(parents=True, exist_ok=True)
+    model.save(str(model_path(model_dir)))
+    with open(state_path(model_dir), 'w') as file:
+        json.dump({'watermark': str(watermark), 'vocabulary_size': len(model.wv.vocab)}, file)
+
+################################################################################################################################################################
+#3.) TRAINING
+
+##Train a new model on the corpus, or continue training the saved model on its newest sentences
+##The corpus is the full CourseCorpus, usually memory-mapped with update_corpus, streamed to gensim sentence by sentence
+##new_sentences is the number of sentences at the end of the corpus added since the saved model, all of them when None
+##When continuing, a new course code joins the vocabulary once it has min_count occurrences in the whole corpus,
+##not only in the new sentences, and the saved weights are the starting point
+##new_counts maps course codes to their number of opportunities newer than the saved watermark, the counts added to known codes
+##The new sentences are full histories, so counting them would add a returning person's earlier courses again on every run
+def train_or_update(corpus, model_dir, watermark, new_sentences=None, new_counts=None, **params):
+    params = dict(MODEL_PARAMS, **params)
+    start = timeit.default_timer()
+    new_corpus = corpus.tail(len(corpus) if new_sentences is None else new_sentences)
+    if load_state(model_dir) is None:
+        if len(corpus) == 0:
+            raise ValueError('No opportunities to train a new model on')
+        model = gensim.models.Word2Vec(sentences=corpus, **params)
+        print('Trained new model')
+    elif len(new_corpus) == 0:
+        print('No new opportunities, using saved model')
+        return gensim.models.Word2Vec.load(str(model_path(model_dir)))
+    else:
+        model = gensim.models.Word2Vec.load(str(model_path(model_dir)))
+        vocabulary_size = len(model.wv.vocab)
+        ##gensim adds the counts of known words to their saved counts and applies min_count to the counts of new words
+        if new_counts is None:
+            new_counts = {str(word): count for word, count in zip(corpus.vocabulary, new_corpus.counts())}
+        word_freq = {str(word): int(new_counts.get(str(word), 0) if word in model.wv.vocab else count)
+                     for word, count, new_count in zip(corpus.vocabulary, corpus.counts(), new_corpus.counts())
+                     if new_count > 0}
+        model.build_vocab_from_freq(word_freq, corpus_count=len(new_corpus), update=True)
+        model.train(new_corpus,
+                    total_examples=len(new_corpus),
+                    total_words=new_corpus.number_of_words(),
+                    epochs=model.epochs)
+        print('Updated model, {} new course codes'.format(len(model.wv.vocab) - vocabulary_size))
+    print('Time: ', timeit.default_timer() - start)
+    save(model, model_dir, watermark)
+    return model
@@ -0,0 +1,38 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COURSE INDEX
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import pandas
+
+################################################################################################################################################################
+#2.) INDEX
+
+##Course metadata indexed by course code, built once from the course table
+##A course code with several abbreviations keeps the first as its abbreviation and all of them in course_abbreviations
+class CourseIndex:
+
+    def __init__(self, df_course):
+        df_course = df_course.drop_duplicates()
+        self.frame = (df_course.groupby('course_code', sort=False, observed=True)
+                               .agg(course_abbreviation=('course_abbreviation', 'first'),
+                                    course_abbreviations=('course_abbreviation', lambda abbreviations: ' / '.join(abbreviations.unique())),
+                                    course=('course', 'first'),
+                                    university_abbreviation=('university_abbreviation', 'first'),
+                                    university=('university', 'first')))
+        self.abbreviations = self.frame['course_abbreviation'].to_dict()
+
+    def __contains__(self, course_code):
+        return course_code in self.abbreviations
+
+    ##Abbreviation of one course code
+    def abbreviation(self, course_code, default=None):
+        return self.abbreviations.get(course_code, default if default is not None else course_code)
+
+    ##Metadata rows for the given course codes, in the same order, with course_code as a column
+    def lookup(self, course_codes):
+        return self.frame.reindex(pandas.Index(course_codes, name='course_code')).reset_index()
@@ -0,0 +1,81 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COURSE PROJECTION
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import hashlib
+import os
+import pathlib
+import timeit
+import numpy
+import sklearn.decomposition
+import sklearn.manifold
+
+##openTSNE is optional, it adds the FFT accelerated t-SNE used for large vocabularies
+try:
+    import openTSNE
+except ImportError:
+    openTSNE = None
+
+##Projection settings
+CACHE_DIR = pathlib.Path.home() / 'course2vec' / 'projection'
+PERPLEXITY = 40
+N_JOBS = os.cpu_count()
+RANDOM_STATE = 23
+
+################################################################################################################################################################
+#2.) PROJECTION
+
+##Contiguous float32 matrix of every vocabulary vector, taken straight from the gensim KeyedVectors
+def embedding_matrix(wv):
+    return list(wv.index2word), numpy.ascontiguousarray(wv.vectors, dtype=numpy.float32)
+
+##Version of a model's embeddings: a hash of the vectors and vocabulary
+def model_version(words, vectors):
+    digest = hashlib.sha256(numpy.ascontiguousarray(vectors).tobytes())
+    digest.update('\n'.join(words).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+##Method that actually runs for a requested method: 'fft' falls back to 'barnes_hut' without openTSNE
+def resolved_method(method):
+    return 'barnes_hut' if method == 'fft' and openTSNE is None else method
+
+##2D coordinates for the vectors
+##'fft' uses openTSNE when installed, 'barnes_hut' uses sklearn, both start from a PCA layout; 'pca' is the fastest
+def project(vectors, method='fft', perplexity=PERPLEXITY, n_jobs=N_JOBS, random_state=RANDOM_STATE):
+    method = resolved_method(method)
+    perplexity = min(perplexity, max(1, (len(vectors) - 1) / 3))
+    if method == 'pca':
+        return sklearn.decomposition.PCA(n_components=2, random_state=random_state).fit_transform(vectors)
+    if method == 'fft':
+        return numpy.asarray(openTSNE.TSNE(perplexity=perplexity,
+                                           initialization='pca',
+                                           negative_gradient_method='fft',
+                                           n_jobs=n_jobs,
+                                           random_state=random_state).fit(vectors))
+    return sklearn.manifold.TSNE(n_components=2,
+                                 perplexity=perplexity,
+                                 init='pca',
+                                 method='barnes_hut',
+                                 n_jobs=n_jobs,
+                                 random_state=random_state).fit_transform(vectors)
+
+##Projection of a model's embeddings, cached by model version and method so the layout is only computed once
+##The cache is keyed on the method that runs, so a Barnes-Hut layout is never stored as an FFT one
+def cached_projection(wv, method='fft', perplexity=PERPLEXITY, cache_dir=CACHE_DIR):
+    method = resolved_method(method)
+    words, vectors = embedding_matrix(wv)
+    path = pathlib.Path(cache_dir) / '{}_{}_{}.npy'.format(model_version(words, vectors), method, perplexity)
+    if path.exists():
+        print('Loaded projection from cache')
+        return words, numpy.load(path)
+    start = timeit.default_timer()
+    coordinates = project(vectors, method, perplexity)
+    print('Projection time ({}): '.format(method), timeit.default_timer() - start)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    numpy.save(path, coordinates)
+    return words, coordinates
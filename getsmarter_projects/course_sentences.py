@@ -0,0 +1,129 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COURSE SENTENCES
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import json
+import pathlib
+import numpy
+import pandas
+
+################################################################################################################################################################
+#2.) CORPUS
+
+##Sentences of course tokens stored as one int32 token array with sentence offsets (CSR layout)
+##Sentence i is tokens[offsets[i]:offsets[i + 1]], a slice rather than a copy
+##people holds the person of every sentence, so a later extract can replace a person's sentence
+class CourseCorpus:
+
+    def __init__(self, tokens, offsets, vocabulary, people=None):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.vocabulary = vocabulary
+        self.people = people
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    ##Token ids of one sentence
+    def sentence_ids(self, index):
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    ##Course codes of one sentence
+    def sentence(self, index):
+        return self.vocabulary[self.sentence_ids(index)].tolist()
+
+    ##Yield every sentence as a list of course codes, restartable for each training epoch
+    ##gensim reads this on one thread and hands batches of sentences to its worker threads
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.sentence(index)
+
+    ##Total number of tokens, passed to gensim as total_words
+    def number_of_words(self):
+        return int(self.offsets[-1] - self.offsets[0])
+
+    ##Number of times every vocabulary word occurs
+    def counts(self):
+        return numpy.bincount(numpy.asarray(self.tokens[self.offsets[0]:self.offsets[-1]]), minlength=len(self.vocabulary))
+
+    ##The last number_of_sentences sentences, sharing the token array
+    def tail(self, number_of_sentences):
+        start = len(self) - number_of_sentences
+        return CourseCorpus(self.tokens,
+                            self.offsets[start:],
+                            self.vocabulary,
+                            self.people[start:] if self.people is not None else None)
+
+    ##Corpus with the sentences of other appended, replacing any earlier sentence of the same person
+    ##Existing words keep their token ids and new words are added to the end of the vocabulary
+    def merge(self, other):
+        vocabulary = numpy.concatenate([self.vocabulary, other.vocabulary[~numpy.isin(other.vocabulary, self.vocabulary)]])
+        remap = pandas.Index(vocabulary).get_indexer(other.vocabulary).astype(numpy.int32)
+        lengths = numpy.diff(self.offsets)
+        keep = ~numpy.isin(self.people, other.people)
+        tokens = numpy.concatenate([numpy.asarray(self.tokens[self.offsets[0]:self.offsets[-1]])[numpy.repeat(keep, lengths)],
+                                    remap[numpy.asarray(other.tokens[other.offsets[0]:other.offsets[-1]])]])
+        lengths = numpy.concatenate([lengths[keep], numpy.diff(other.offsets)])
+        offsets = numpy.concatenate([[0], numpy.cumsum(lengths)]).astype(numpy.int64)
+        return CourseCorpus(tokens, offsets, vocabulary, numpy.concatenate([self.people[keep], other.people]))
+
+    ##Save as a token array, an offsets array and the vocabulary
+    def save(self, directory):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        numpy.save(directory / 'tokens.npy', numpy.ascontiguousarray(self.tokens, dtype=numpy.int32))
+        numpy.save(directory / 'offsets.npy', numpy.ascontiguousarray(self.offsets, dtype=numpy.int64))
+        with open(directory / 'vocabulary.json', 'w') as file:
+            json.dump([str(word) for word in self.vocabulary], file)
+        if self.people is not None:
+            with open(directory / 'people.json', 'w') as file:
+                json.dump([str(person) for person in self.people], file)
+
+    ##Write one space separated sentence per line, the format gensim shards across workers with corpus_file
+    def write_line_sentence(self, path):
+        with open(path, 'w') as file:
+            for sentence in self:
+                file.write(' '.join(sentence) + '\n')
+
+##Group opportunities into one sentence per person of their course codes in course code order
+##With an order_column, tokens within a sentence are ordered by that column first, e.g. to keep a course's tokens together
+def build_corpus(df, person_column='person_code', course_column='course_code', order_column=None):
+    person_ids, people = pandas.factorize(df[person_column], sort=True)
+    course_ids, courses = pandas.factorize(df[course_column], sort=True)
+    order_ids = pandas.factorize(df[order_column], sort=True)[0] if order_column is not None else numpy.zeros_like(person_ids)
+    valid = (person_ids >= 0) & (course_ids >= 0)
+    person_ids, course_ids, order_ids = person_ids[valid], course_ids[valid], order_ids[valid]
+    order = numpy.lexsort((course_ids, order_ids, person_ids))
+    tokens = course_ids[order].astype(numpy.int32)
+    sentence_lengths = numpy.bincount(person_ids, minlength=len(people))
+    people = numpy.asarray(people, dtype=object)[sentence_lengths > 0]
+    sentence_lengths = sentence_lengths[sentence_lengths > 0]
+    offsets = numpy.concatenate([[0], numpy.cumsum(sentence_lengths)]).astype(numpy.int64)
+    return CourseCorpus(tokens, offsets, numpy.asarray(courses, dtype=object), people)
+
+##Load a saved corpus with the token and offset arrays memory-mapped, so sentences stream from disk
+def load_corpus(directory, mmap_mode='r'):
+    directory = pathlib.Path(directory)
+    tokens = numpy.load(directory / 'tokens.npy', mmap_mode=mmap_mode)
+    offsets = numpy.load(directory / 'offsets.npy', mmap_mode=mmap_mode)
+    with open(directory / 'vocabulary.json') as file:
+        vocabulary = numpy.asarray(json.load(file), dtype=object)
+    people = None
+    if (directory / 'people.json').exists():
+        with open(directory / 'people.json') as file:
+            people = numpy.asarray(json.load(file), dtype=object)
+    return CourseCorpus(tokens, offsets, vocabulary, people)
+
+##Merge new sentences into the corpus saved in a directory, save the result and load it back memory-mapped
+##The new sentences are the tail of the returned corpus, a saved corpus without people is replaced
+def update_corpus(directory, corpus):
+    directory = pathlib.Path(directory)
+    if (directory / 'people.json').exists():
+        corpus = load_corpus(directory, mmap_mode=None).merge(corpus)
+    corpus.save(directory)
+    return load_corpus(directory)
@@ -0,0 +1,77 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# COURSE SIMILARITY
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import numpy
+import pandas
+
+##Batch settings: memory a chunk of query scores may use, and the bytes used per score
+##Each score is a float32 plus the negated copy and int64 index array argpartition makes
+MEMORY_BUDGET_BYTES = 256 * 1024 ** 2
+BYTES_PER_SCORE = 16
+
+################################################################################################################################################################
+#2.) VECTORS
+
+##Vocabulary and unit length float32 vectors of a gensim KeyedVectors
+def normalised_vectors(wv):
+    words = numpy.asarray(wv.index2word, dtype=object)
+    vectors = numpy.ascontiguousarray(wv.vectors, dtype=numpy.float32)
+    norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+    return words, vectors / numpy.maximum(norms, numpy.finfo(numpy.float32).tiny)
+
+##Indices and scores of the topn largest scores in each row, best first
+def top_k(scores, topn):
+    topn = min(topn, scores.shape[1])
+    candidates = numpy.argpartition(-scores, topn - 1, axis=1)[:, :topn]
+    candidate_scores = numpy.take_along_axis(scores, candidates, axis=1)
+    order = numpy.argsort(-candidate_scores, axis=1)
+    return numpy.take_along_axis(candidates, order, axis=1), numpy.take_along_axis(candidate_scores, order, axis=1)
+
+################################################################################################################################################################
+#3.) BATCH QUERIES
+
+##Top-k cosine neighbours of one chunk of query rows, excluding each query itself
+def _chunk_most_similar(vectors, query_rows, topn):
+    scores = vectors[query_rows] @ vectors.T
+    scores[numpy.arange(len(query_rows)), query_rows] = -numpy.inf
+    return top_k(scores, topn)
+
+##Number of query rows per chunk so that a chunk's scores stay within the memory budget
+def chunk_rows(number_of_words, memory_budget=MEMORY_BUDGET_BYTES):
+    return max(1, memory_budget // (BYTES_PER_SCORE * max(number_of_words, 1)))
+
+##Top-k most similar courses for many course codes (all of them by default) as a tidy dataframe
+##Scores come from one normalised matrix product per chunk of queries, chunks are sized from the memory budget
+##and run one after the other, the matrix product itself is multithreaded by BLAS
+def batch_most_similar(wv, course_codes=None, topn=10, memory_budget=MEMORY_BUDGET_BYTES, course_index=None):
+    words, vectors = normalised_vectors(wv)
+    positions = pandas.Index(words)
+    if course_codes is None:
+        query_rows = numpy.arange(len(words))
+    else:
+        query_rows = positions.get_indexer(course_codes)
+        missing = numpy.asarray(course_codes, dtype=object)[query_rows < 0]
+        if len(missing):
+            print('Course codes not in vocabulary:', list(missing))
+        query_rows = query_rows[query_rows >= 0]
+    topn = min(topn, len(words) - 1)
+    neighbours = numpy.empty((len(query_rows), topn), dtype=numpy.int64)
+    similarities = numpy.empty((len(query_rows), topn), dtype=numpy.float32)
+    chunk_size = chunk_rows(len(words), memory_budget)
+    for start in range(0, len(query_rows), chunk_size):
+        end = start + chunk_size
+        neighbours[start:end], similarities[start:end] = _chunk_most_similar(vectors, query_rows[start:end], topn)
+    df_similar = pandas.DataFrame({'course_code': numpy.repeat(words[query_rows], topn),
+                                   'rank': numpy.tile(numpy.arange(1, topn + 1), len(query_rows)),
+                                   'similar_course_code': words[neighbours.ravel()],
+                                   'similarity': similarities.ravel()})
+    if course_index is not None:
+        df_similar['course_abbreviation'] = df_similar['course_code'].map(course_index.abbreviations)
+        df_similar['similar_course_abbreviation'] = df_similar['similar_course_code'].map(course_index.abbreviations)
+    return df_similar
@@ -7,72 +7,100 @@
 #1.) SETUP
 
 ##Import libraries
+import argparse
 import pandas
 import numpy
-import psycopg2
-import configparser
-import pathlib
 import plotly.express
-
-##Connect config file
-config = configparser.ConfigParser()
-config_file = str(pathlib.Path.home())+'/config.ini'
-config.read(config_file)
+import column_projection
+import extract_cache
+import extract_schema
+import figure_export
+import forum_staging
+import grouped_correlation
+import memo_store
+import module_activity
+import pipeline
+import rdw_connection
+import scatter_report
+
+##Every section below is a stage of this pipeline, run from the command line at the end of the file
+##Outputs of the analysis stages are kept in the memo store, so a change to one section reruns only that section and what reads from it
+##Reports, figures and csv exports are unmemoized stages that read those outputs, so they are printed and written on every run
+analysis = pipeline.Pipeline(memo_store=memo_store.MemoStore())
 
 ################################################################################################################################################################
 #2.) EXTRACT DATA FOR CORRELATION ANALYSIS
 
+##2.0) Forum activity staging table
+##All forum activity queries below read the classified rows from rdw_la.stg_forum_activity
+##Its version keys the cached extracts below, together with the snapshot date as they also join the rdw_bcd views and module grades
+##With REFRESH_STAGING (--refresh-staging) the partitions changed since the last watermark are rebuilt,
+##with FULL_REFRESH (--full-refresh) the whole table is rebuilt, otherwise its current version is read
+##On a warehouse without the table yet it is created and filled first
+REFRESH_STAGING = False
+FULL_REFRESH = False
+
+@analysis.stage(outputs=['staging_version'], memoize=False)
+def staging():
+    if REFRESH_STAGING or FULL_REFRESH or not forum_staging.exists():
+        return forum_staging.refresh(full=FULL_REFRESH)
+    return forum_staging.version()
+
 ##2.1) Extract data from database
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
+##Columns of df_extract read by each stage, only the columns of the stages that will run are extracted
+extract_columns_by_stage = {'clean': ['final_mark', 'number_of_posts', 'customer_tribe'],
+                            'total_level': ['final_mark', 'number_of_posts'],
+                            'total_plots': ['final_mark', 'number_of_posts', 'course_abbreviation'],
+                            'course_level': ['course_abbreviation', 'final_mark', 'number_of_posts'],
+                            'course_plots': ['course_abbreviation', 'final_mark', 'number_of_posts', 'student_name'],
+                            'sub_vertical_level': ['subject_vertical', 'final_mark', 'number_of_posts'],
+                            'sub_vertical_plots': ['subject_vertical', 'final_mark', 'number_of_posts'],
+                            'course_type_level': ['course_type', 'subject_vertical', 'final_mark', 'number_of_posts']}
+
+##Every column the extract can return, with its expression
+extract_expressions = {'university': 'B.university',
+                       'university_abbreviation': 'B.university_code',
+                       'course': 'B.course_name',
+                       'course_abbreviation': "CONCAT(B.university_code, '-', B.course_abbreviation)",
+                       'presentation': 'B.presentation_name',
+                       'presentation_abbreviation': 'B.presentation_abbreviation',
+                       'vle_course_id': 'A.vle_course_id',
+                       'presentation_start_date': 'B.presentation_start_date',
+                       'activity_type': 'E.activity_type',
+                       'activity_name': 'E.activity_name',
+                       'course_type': 'B.course_type',
+                       'subject_vertical': 'B.subject_vertical',
+                       'customer_tribe': 'B.customer_tribe',
+                       'vle_user_id': 'A.vle_user_id',
+                       'student_name': 'E.student_name',
+                       'final_mark': 'A.final_mark',
+                       'number_of_posts': 'E.number_of_posts'}
+
+##Student activity rows keep one row per activity: the activity columns stay in the GROUP BY even when they are not selected
+##student_name depends on the user only, so adding it to the GROUP BY does not change the rows
+activity_keys = ['university', 'course_id', 'activity_type', 'activity_name', 'user_id']
+activity_expressions = {'la_university': 'university',
+                        'vle_course_id': 'course_id',
+                        'vle_user_id': 'user_id',
+                        'activity_type': 'activity_type',
+                        'activity_name': 'activity_name',
+                        'student_name': "CONCAT(firstname, ' ', lastname)",
+                        'number_of_posts': 'SUM(all_posts)'}
 
 ##Sql query
-sql = """
-SELECT B.university,
-       B.university_code AS university_abbreviation,
-       B.course_name AS course,
-       CONCAT(B.university_code, '-', B.course_abbreviation) AS course_abbreviation,
-       B.presentation_name AS presentation,
-       B.presentation_abbreviation,
-       A.vle_course_id,
-       B.presentation_start_date,
-       E.activity_type,
-       E.activity_name,
-       B.course_type,
-       B.subject_vertical,
-       B.customer_tribe,
-       A.vle_user_id,
-       E.student_name,
-       A.final_mark,
-       E.number_of_posts
+extract_sql = """
+SELECT {select}
 FROM rdw_bcd.vw_bcd_enrolment A
 LEFT JOIN rdw_bcd.vw_bcd_registration B ON B.registration_id = A.registration_id
 LEFT JOIN rdw_bcd.vw_bcd_presentation C ON C.presentation_code = A.presentation_code
 LEFT JOIN rdw_bcd.vw_bcd_partner D ON D.vle_credential_id = C.vle_credential_id
                                    AND D.university_code = C.university_code
-LEFT JOIN (SELECT university AS la_university,
-                  course_id AS vle_course_id,
-                  user_id AS vle_user_id,
-                  activity_type,
-                  activity_name,
-                  user_role,
-                  CONCAT(firstname, ' ', lastname) AS student_name,
-                  SUM(all_posts) AS number_of_posts
-           FROM rdw_la.vw_master_alluser_activities
+LEFT JOIN (SELECT {activity_select}
+           FROM rdw_la.stg_forum_activity
            WHERE user_role = 'student'
-           AND (LOWER(activity_name) LIKE '%class-wide%'
-                OR LOWER(activity_name) LIKE '%class wide%')
-           AND LOWER(module_name) NOT LIKE '%orientation%'
-           GROUP BY university,
-                    course_id,
-                    activity_type,
-                    activity_name,
-                    user_id,
-                    user_role,
-                    CONCAT(firstname, ' ', lastname)) E ON E.la_university = D.la_university
+           AND is_class_wide
+           AND NOT is_orientation_module
+           GROUP BY {activity_group_by}) E ON E.la_university = D.la_university
                                                         AND E.vle_course_id = A.vle_course_id
                                                         AND E.vle_user_id = A.vle_user_id
 WHERE C.product_life_cycle_status = 'Completed'
@@ -81,392 +109,293 @@ AND A.vle_user_id IS NOT NULL
 AND A.vle_course_id IS NOT NULL;
 """
 
+##Extract query selecting only the given columns
+def extract_query(columns):
+    activity_columns = ['la_university', 'vle_course_id', 'vle_user_id'] + columns
+    return extract_sql.format(select=column_projection.select_clause(extract_expressions, columns),
+                              activity_select=column_projection.select_clause(activity_expressions, activity_columns, ',\n                  '),
+                              activity_group_by=column_projection.group_by_clause(activity_keys,
+                                                                                  {'student_name': activity_expressions['student_name']},
+                                                                                  activity_columns,
+                                                                                  ',\n                    '))
+
+##Columns extracted by this run, every stage's columns unless the run block narrows them to the selected stages
+EXTRACT_COLUMNS = column_projection.required_columns(extract_expressions, extract_columns_by_stage, extract_columns_by_stage)
+
+##Column types, repeated strings are held as categoricals, ids as 64 bit and measures as 32 bit
+df_extract_schema = {'course_abbreviation': 'category',
+                     'course_type': 'category',
+                     'subject_vertical': 'category',
+                     'customer_tribe': 'category',
+                     'student_name': 'category',
+                     'final_mark': 'float32',
+                     'number_of_posts': 'float32'}
+
 ##Create pandas dataframe
-df_extract = pandas.read_sql_query(sql, rdw_conn)
+@analysis.stage(inputs=['staging_version'], outputs=['df_extract_raw'], memoize=False)
+def extract(staging_version):
+    return extract_cache.read_sql(extract_query(EXTRACT_COLUMNS), name='df_extract', source_version=extract_cache.snapshot_version(staging_version), schema=df_extract_schema)
 
 ##2.2) Clean data
-##Clean df_extract
-df_extract = df_extract.fillna(0)
-df_extract['final_mark'].values[df_extract['final_mark'].values > 100] = 100
-print(df_extract.head(20))
-print('Number of Total Students:', len(df_extract))
-
-##2.3) Create subset dataframes
-##Create dataframe for number of post greater than 1
-df_greater_than_1 = df_extract[df_extract['number_of_posts'] > 1]
-print(df_greater_than_1.head(20))
-print('Number of Total Students (Posts greater than 1):', len(df_greater_than_1))
-
-##Create dataframe for number of post less than 10
-df_greater_than_5 = df_extract[df_extract['number_of_posts'] > 5]
-print(df_greater_than_5.head(20))
-print('Number of Total Students (Posts greater than 5):', len(df_greater_than_5))
-
-##Create dataframe for number of post less than 10
-df_greater_than_10 = df_extract[df_extract['number_of_posts'] > 10]
-print(df_greater_than_10.head(20))
-print('Number of Total Students (Posts greater than 10):', len(df_greater_than_10))
-
-##Create subset for dreamers and realists
-subset_values = ['Dreamers', 'Realists']
-df_dreamers_realists = df_extract[df_extract['customer_tribe'].isin(subset_values)]
-print(df_dreamers_realists.head(20))
-print('Number of Dreamers and Realists:', len(df_dreamers_realists))
+@analysis.stage(inputs=['df_extract_raw'], outputs=['df_extract', 'df_post_threshold', 'df_post_threshold_tribe', 'df_dreamers_realists'])
+def clean(df_extract_raw):
+    ##Clean df_extract
+    df_extract = extract_schema.fill_missing(df_extract_raw, 0)
+    df_extract['final_mark'].values[df_extract['final_mark'].values > 100] = 100
+
+    ##2.3) Post count threshold sweep
+    ##Correlation for every minimum number of posts, computed from one sorted pass without subset copies
+    df_post_threshold = grouped_correlation.threshold_sweep(df_extract, 'number_of_posts', 'final_mark', 'number_of_posts')
+    df_post_threshold = df_post_threshold.set_index('cutoff')
+
+    ##Threshold sweep per customer tribe
+    df_post_threshold_tribe = grouped_correlation.threshold_sweep(df_extract, 'number_of_posts', 'final_mark', 'number_of_posts', by='customer_tribe')
+
+    ##Create subset for dreamers and realists
+    subset_values = ['Dreamers', 'Realists']
+    df_dreamers_realists = df_extract[df_extract['customer_tribe'].isin(subset_values)]
+
+    return df_extract, df_post_threshold, df_post_threshold_tribe, df_dreamers_realists
+
+##Report of the clean data, printed on every run as the memoized stages only print when they compute
+@analysis.stage(inputs=['df_extract', 'df_post_threshold', 'df_post_threshold_tribe', 'df_dreamers_realists'], memoize=False)
+def clean_report(df_extract, df_post_threshold, df_post_threshold_tribe, df_dreamers_realists):
+    print(df_extract.head(20))
+    print('Number of Total Students:', len(df_extract))
+
+    ##Post count threshold sweep
+    print(df_post_threshold.head(20))
+    ##Cutoffs only run up to the highest post count, no student qualifies above it
+    post_counts = df_post_threshold['n'].reindex([1, 5, 10], fill_value=0)
+    print('Number of Total Students (Posts greater than 1):', post_counts[1])
+    print('Number of Total Students (Posts greater than 5):', post_counts[5])
+    print('Number of Total Students (Posts greater than 10):', post_counts[10])
+    print(df_post_threshold_tribe.head(20))
+
+    ##Dreamers and realists
+    print(df_dreamers_realists.head(20))
+    print('Number of Dreamers and Realists:', len(df_dreamers_realists))
 
 ################################################################################################################################################################
 #3.) CORRELATION CALCULATIONS (TOTAL LEVEL)
 
-##3.1) Example of what correlation should look like
-
-##Create data that is normally distributed with strong positive relatonship
-##Set parameters
-x = numpy.array([0, 100])
-y = numpy.array([0, 100])
-means = [x.mean(), y.mean()]
-stds = [x.std() / 3, y.std() / 3]
-corr = 0.8
-covs = [[stds[0]**2, stds[0]*stds[1]*corr],
-        [stds[0]*stds[1]*corr, stds[1]**2]]
-
-##Generate data and put into dataframe
-df_testdata = pandas.DataFrame(numpy.random.multivariate_normal(means, covs, 1000), columns=['final_mark', 'number_of_posts'])
-
-##View dataframe
-print(df_testdata)
-
-##Create figure object
-fig_corr_example = plotly.express.scatter(data_frame=df_testdata,
-                                          x=df_testdata['final_mark'],
-                                          y=df_testdata['number_of_posts'],
-                                          title='Perfect Scenario: Number of Posts by Final Grade',
-                                          trendline='ols',
-                                          trendline_color_override='red',
-                                          labels={'number_of_posts': 'Number of Posts',
-                                                  'final_mark': 'Final Mark'})
-
-##Save figure
-fig_corr_example.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_corr_example.png')
-
-##3.2) Analysis over all courses
-##Calculate the correlation over all the courses
-total_corr = df_extract['final_mark'].corr(df_extract['number_of_posts'])
-print('R-squared on a total level:', total_corr**2)
-
-##Plot posts by final mark
-fig_corr_total = plotly.express.scatter(data_frame=df_extract,
-                                        x=df_extract['final_mark'],
-                                        y=df_extract['number_of_posts'],
-                                        title='Number of Posts by Final Grade',
-                                        trendline='ols',
-                                        trendline_color_override='red',
-                                        hover_data=['number_of_posts',
-                                                    'final_mark',
-                                                    'course_abbreviation'],
-                                        labels={'number_of_posts': 'Number of Posts',
-                                                'final_mark': 'Final Mark',
-                                                'course_abbreviation': 'Course Abbreviation'})
-
-##Edit axes
-fig_corr_total.update_yaxes(range=[0, 100])
-fig_corr_total.update_xaxes(range=[0, 100])
-
-##Edit mark size
-fig_corr_total.update_traces(marker=dict(size=5))
-fig_corr_total.show()
-
-##Save figure
-fig_corr_total.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_corr_total.png')
-
-##3.3) Analysis for greater than 1
-##Calculate the correlation over all the courses
-greater_than_1_corr = df_greater_than_1['final_mark'].corr(df_greater_than_1['number_of_posts'])
-print('R-squared where posts more than 1:', greater_than_1_corr**2)
-
-##3.4) Analysis for greater than 5
-##Calculate the correlation over all the courses
-greater_than_5_corr = df_greater_than_5['final_mark'].corr(df_greater_than_5['number_of_posts'])
-print('R-squared where posts more than 5:', greater_than_5_corr**2)
-
-##3.5) Analysis for greater than 10
-##Calculate the correlation over all the courses
-greater_than_10_corr = df_greater_than_10['final_mark'].corr(df_greater_than_10['number_of_posts'])
-print('R-squared where posts more than 10:', greater_than_10_corr**2)
-
-#3.6) Calculate correlation over all the courses only using Passive's and Dreamers
-##Calculate correlation over all courses for dreamers and realists
-dreamers_realists_corr = df_dreamers_realists['final_mark'].corr(df_dreamers_realists['number_of_posts'])
-print('R-squared for dreamers realists:', dreamers_realists_corr**2)
-
-##Create figure object
-fig_dreamers_realists = plotly.express.scatter(data_frame=df_dreamers_realists,
-                                               x=df_dreamers_realists['final_mark'],
-                                               y=df_dreamers_realists['number_of_posts'],
-                                               title='Dreamers and Realists: Number of Posts by Final Grade',
-                                               trendline='ols',
-                                               trendline_color_override='red',
-                                               hover_data=['number_of_posts',
-                                                           'final_mark',
-                                                           'course_abbreviation'],
-                                               labels={'number_of_posts': 'Number of Posts',
-                                                       'final_mark': 'Final Mark',
-                                                       'course_abbreviation': 'Course Abbreviation'})
-
-##Edit axes
-fig_dreamers_realists.update_yaxes(range=[0, 100])
-fig_dreamers_realists.update_xaxes(range=[0, 100])
-
-##Edit mark size
-fig_dreamers_realists.update_traces(marker=dict(size=5))
-
-##Save figure
-fig_dreamers_realists.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_dreamers_realists.png')
+@analysis.stage(inputs=['df_extract', 'df_dreamers_realists'], outputs=['total_corr', 'dreamers_realists_corr'])
+def total_level(df_extract, df_dreamers_realists):
+    ##3.1) Analysis over all courses
+    ##Calculate the correlation over all the courses
+    total_corr = df_extract['final_mark'].corr(df_extract['number_of_posts'])
+
+    #3.2) Calculate correlation over all the courses only using Passive's and Dreamers
+    ##Calculate correlation over all courses for dreamers and realists
+    dreamers_realists_corr = df_dreamers_realists['final_mark'].corr(df_dreamers_realists['number_of_posts'])
+
+    return total_corr, dreamers_realists_corr
+
+@analysis.stage(inputs=['total_corr', 'dreamers_realists_corr', 'df_post_threshold'], memoize=False)
+def total_report(total_corr, dreamers_realists_corr, df_post_threshold):
+    print('R-squared on a total level:', total_corr**2)
+
+    ##Correlations from the threshold sweep, NaN for cutoffs above the highest post count
+    post_r_squared = df_post_threshold['r_squared'].reindex([1, 5, 10])
+
+    ##3.3) Analysis for greater than 1
+    ##Read the correlation from the threshold sweep
+    print('R-squared where posts more than 1:', post_r_squared[1])
+
+    ##3.4) Analysis for greater than 5
+    ##Read the correlation from the threshold sweep
+    print('R-squared where posts more than 5:', post_r_squared[5])
+
+    ##3.5) Analysis for greater than 10
+    ##Read the correlation from the threshold sweep
+    print('R-squared where posts more than 10:', post_r_squared[10])
+
+    print('R-squared for dreamers realists:', dreamers_realists_corr**2)
+
+##Figures of the total level analysis
+##Plots run as their own unmemoized stage, so they are written and shown even when the correlations come from the memo store
+@analysis.stage(inputs=['df_extract', 'df_dreamers_realists'], memoize=False)
+def total_plots(df_extract, df_dreamers_realists):
+    ##3.6) Example of what correlation should look like
+
+    ##Create data that is normally distributed with strong positive relatonship
+    ##Set parameters
+    x = numpy.array([0, 100])
+    y = numpy.array([0, 100])
+    means = [x.mean(), y.mean()]
+    stds = [x.std() / 3, y.std() / 3]
+    corr = 0.8
+    covs = [[stds[0]**2, stds[0]*stds[1]*corr],
+            [stds[0]*stds[1]*corr, stds[1]**2]]
+
+    ##Generate data and put into dataframe
+    df_testdata = pandas.DataFrame(numpy.random.multivariate_normal(means, covs, 1000), columns=['final_mark', 'number_of_posts'])
+
+    ##View dataframe
+    print(df_testdata)
+
+    ##Create figure object
+    fig_corr_example = plotly.express.scatter(data_frame=df_testdata,
+                                              x=df_testdata['final_mark'],
+                                              y=df_testdata['number_of_posts'],
+                                              title='Perfect Scenario: Number of Posts by Final Grade',
+                                              trendline='ols',
+                                              trendline_color_override='red',
+                                              labels={'number_of_posts': 'Number of Posts',
+                                                      'final_mark': 'Final Mark'})
+
+    ##Save figure
+    figure_export.write_image(fig_corr_example, '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_corr_example.png')
+
+    ##3.7) Plot posts by final mark over all courses
+    ##Large extracts are binned into a density grid, with the trendline fitted on every row
+    if len(df_extract) > scatter_report.LARGE_DATA_ROWS:
+        fig_corr_total = scatter_report.large_scatter(df_extract,
+                                                      'final_mark',
+                                                      'number_of_posts',
+                                                      'Number of Posts by Final Grade',
+                                                      axis_range=[0, 100])
+    else:
+        fig_corr_total = plotly.express.scatter(data_frame=df_extract,
+                                                x=df_extract['final_mark'],
+                                                y=df_extract['number_of_posts'],
+                                                title='Number of Posts by Final Grade',
+                                                trendline='ols',
+                                                trendline_color_override='red',
+                                                hover_data=['number_of_posts',
+                                                            'final_mark',
+                                                            'course_abbreviation'],
+                                                labels={'number_of_posts': 'Number of Posts',
+                                                        'final_mark': 'Final Mark',
+                                                        'course_abbreviation': 'Course Abbreviation'})
+
+        ##Edit axes
+        fig_corr_total.update_yaxes(range=[0, 100])
+        fig_corr_total.update_xaxes(range=[0, 100])
+
+        ##Edit mark size
+        fig_corr_total.update_traces(marker=dict(size=5))
+
+    fig_corr_total.show()
+
+    ##Save figure
+    figure_export.write_image(fig_corr_total, '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_corr_total.png')
+
+    ##3.8) Plot posts by final mark for dreamers and realists
+    ##Create figure object
+    ##Large extracts are binned into a density grid, with the trendline fitted on every row
+    if len(df_dreamers_realists) > scatter_report.LARGE_DATA_ROWS:
+        fig_dreamers_realists = scatter_report.large_scatter(df_dreamers_realists,
+                                                             'final_mark',
+                                                             'number_of_posts',
+                                                             'Dreamers and Realists: Number of Posts by Final Grade',
+                                                             axis_range=[0, 100])
+    else:
+        fig_dreamers_realists = plotly.express.scatter(data_frame=df_dreamers_realists,
+                                                       x=df_dreamers_realists['final_mark'],
+                                                       y=df_dreamers_realists['number_of_posts'],
+                                                       title='Dreamers and Realists: Number of Posts by Final Grade',
+                                                       trendline='ols',
+                                                       trendline_color_override='red',
+                                                       hover_data=['number_of_posts',
+                                                                   'final_mark',
+                                                                   'course_abbreviation'],
+                                                       labels={'number_of_posts': 'Number of Posts',
+                                                               'final_mark': 'Final Mark',
+                                                               'course_abbreviation': 'Course Abbreviation'})
+
+        ##Edit axes
+        fig_dreamers_realists.update_yaxes(range=[0, 100])
+        fig_dreamers_realists.update_xaxes(range=[0, 100])
+
+        ##Edit mark size
+        fig_dreamers_realists.update_traces(marker=dict(size=5))
+
+    ##Save figure
+    figure_export.write_image(fig_dreamers_realists, '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_dreamers_realists.png')
 
 ################################################################################################################################################################
 #4.) CORRELATION CALCULATIONS (COURSE LEVEL)
 
-##Calculate correlation for each course abbreviation
-df_corr_courses = pandas.DataFrame(df_extract.groupby('course_abbreviation')[['final_mark', 'number_of_posts']].corr().iloc[0::2,-1]).reset_index()
-
-##Edit resulting dataframe
-df_corr_courses = df_corr_courses[['course_abbreviation', 'number_of_posts']]
-df_corr_courses = df_corr_courses.rename(columns={'number_of_posts': 'r_squared'})
-df_corr_courses['r_squared'] = df_corr_courses['r_squared'] ** 2
-df_corr_courses = df_corr_courses.sort_values(by='r_squared', ascending=False)
-
-##View dataframe
-print(df_corr_courses.head(20))
-
-##Plot: GWU-SCO
-##Create subset dataframe
-df_gwu_sco = df_extract[df_extract['course_abbreviation'].str.contains('GWU-SCO')]
-
-##View dataframe
-print(df_gwu_sco.head(20))
-
-##Create figure object
-fig_gwu_sco = plotly.express.scatter(data_frame=df_gwu_sco,
-                                     x=df_gwu_sco['final_mark'],
-                                     y=df_gwu_sco['number_of_posts'],
-                                     title='GWU-SCO: Number of Posts by Final Grade',
-                                     trendline='ols',
-                                     trendline_color_override='red',
-                                     hover_data=['number_of_posts',
-                                                 'final_mark',
-                                                 'student_name'],
-                                     labels={'number_of_posts': 'Number of Posts',
-                                             'final_mark': 'Final Mark',
-                                             'student_name': 'Student Name'})
-
-##Save figure
-fig_gwu_sco.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_gwu_sco.png')
-
-##Plot: LSE-TFT
-##Create subset dataframe
-df_lse_tft = df_extract[df_extract['course_abbreviation'].str.contains('LSE-TFT')]
-
-##View dataframe
-print(df_lse_tft.head(20))
-
-##Create figure object
-fig_lse_tft = plotly.express.scatter(data_frame=df_lse_tft,
-                                     x=df_lse_tft['final_mark'],
-                                     y=df_lse_tft['number_of_posts'],
-                                     title='LSE-TFT: Number of Posts by Final Grade',
-                                     trendline='ols',
-                                     trendline_color_override='red',
-                                     hover_data=['number_of_posts',
-                                                 'final_mark',
-                                                 'student_name'],
-                                     labels={'number_of_posts': 'Number of Posts',
-                                             'final_mark': 'Final Mark',
-                                             'student_name': 'Student Name'})
-
-##Save figure
-fig_lse_tft.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_lse_tft.png')
-
-##Plot: SYR-FNM
-##Create subset dataframe
-df_syr_fnm = df_extract[df_extract['course_abbreviation'].str.contains('SYR-FNM')]
-
-##View dataframe
-print(df_syr_fnm.head(20))
-
-##Create figure object
-fig_syr_fnm = plotly.express.scatter(data_frame=df_syr_fnm,
-                                     x=df_syr_fnm['final_mark'],
-                                     y=df_syr_fnm['number_of_posts'],
-                                     title='SYR-FNM: Number of Posts by Final Grade',
-                                     trendline='ols',
-                                     trendline_color_override='red',
-                                     hover_data=['number_of_posts',
-                                                 'final_mark',
-                                                 'student_name'],
-                                     labels={'number_of_posts': 'Number of Posts',
-                                             'final_mark': 'Final Mark',
-                                             'student_name': 'Student Name'})
-
-##Save figure
-fig_syr_fnm.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_syr_fnm.png')
-
-##Plot: RICE-BDO
-##Create subset dataframe
-df_rice_bdo = df_extract[df_extract['course_abbreviation'].str.contains('RICE-BDO')]
-
-##View dataframe
-print(df_rice_bdo.head(20))
-
-##Create figure object
-fig_rice_bdo = plotly.express.scatter(data_frame=df_rice_bdo,
-                                      x=df_rice_bdo['final_mark'],
-                                      y=df_rice_bdo['number_of_posts'],
-                                      title='RICE-BDO: Number of Posts by Final Grade',
-                                      trendline='ols',
-                                      trendline_color_override='red',
-                                      hover_data=['number_of_posts',
-                                                  'final_mark',
-                                                  'student_name'],
-                                      labels={'number_of_posts': 'Number of Posts',
-                                              'final_mark': 'Final Mark',
-                                              'student_name': 'Student Name'})
-
-##Save figure
-fig_rice_bdo.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_rice_bdo.png')
-
-##Plot: RICE-RED
-##Create subset dataframe
-df_rice_red = df_extract[df_extract['course_abbreviation'].str.contains('RICE-RED')]
-
-##View dataframe
-print(df_rice_red.head(20))
-
-##Create figure object
-fig_rice_red = plotly.express.scatter(data_frame=df_rice_red,
-                                      x=df_rice_red['final_mark'],
-                                      y=df_rice_red['number_of_posts'],
-                                      title='RICE-RED: Number of Posts by Final Grade',
-                                      trendline='ols',
-                                      trendline_color_override='red',
-                                      hover_data=['number_of_posts',
-                                                  'final_mark',
-                                                  'student_name'],
-                                      labels={'number_of_posts': 'Number of Posts',
-                                              'final_mark': 'Final Mark',
-                                              'student_name': 'Student Name'})
-
-##Save figure
-fig_rice_red.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_rice_red.png')
-
-##Plot: UCT-MRS
-##Create subset dataframe
-df_uct_mrs = df_extract[df_extract['course_abbreviation'].str.contains('UCT-MRS')]
-
-##View dataframe
-print(df_uct_mrs.head(20))
-
-##Create figure object
-fig_uct_mrs = plotly.express.scatter(data_frame=df_uct_mrs,
-                                     x=df_uct_mrs['final_mark'],
-                                     y=df_uct_mrs['number_of_posts'],
-                                     title='UCT-MRS: Number of Posts by Final Grade',
-                                     trendline='ols',
-                                     trendline_color_override='red',
-                                     hover_data=['number_of_posts',
-                                                 'final_mark',
-                                                 'student_name'],
-                                     labels={'number_of_posts': 'Number of Posts',
-                                             'final_mark': 'Final Mark',
-                                             'student_name': 'Student Name'})
-
-##Save figure
-fig_uct_mrs.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_uct_mrs.png')
+@analysis.stage(inputs=['df_extract'], outputs=['df_corr_courses'])
+def course_level(df_extract):
+    ##Calculate correlation for each course abbreviation
+    df_corr_courses = grouped_correlation.grouped_pearson(df_extract, 'course_abbreviation', 'final_mark', 'number_of_posts')
+
+    return df_corr_courses
+
+@analysis.stage(inputs=['df_corr_courses'], memoize=False)
+def course_report(df_corr_courses):
+    ##View dataframe
+    print(df_corr_courses.head(20))
+
+@analysis.stage(inputs=['df_extract'], memoize=False)
+def course_plots(df_extract):
+    ##Plot: every course
+    ##Rows are sorted by course once and each course is plotted from its slice
+    scatter_report.scatter_report(df_extract,
+                                  'course_abbreviation',
+                                  '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis',
+                                  hover_data=['number_of_posts', 'final_mark', 'student_name'])
 
 ################################################################################################################################################################
 #5.) CORRELATION CALCULATIONS (SUBJECT VERTICAL GROUPS)
 
-##Calculate correlation for each course abbreviation
-df_corr_sub_vertical = pandas.DataFrame(df_extract.groupby('subject_vertical')[['final_mark', 'number_of_posts']].corr().iloc[0::2,-1]).reset_index()
-
-##Edit resulting dataframe
-df_corr_sub_vertical = df_corr_sub_vertical[['subject_vertical', 'number_of_posts']]
-df_corr_sub_vertical = df_corr_sub_vertical.rename(columns={'number_of_posts': 'r_squared'})
-df_corr_sub_vertical['r_squared'] = df_corr_sub_vertical['r_squared'] ** 2
-df_corr_sub_vertical = df_corr_sub_vertical.sort_values(by='r_squared', ascending=False)
-print(df_corr_sub_vertical.head(20))
-
-##Plot: Politics subject vertical
-##Create subset dataframe
-df_politics = df_extract[df_extract['subject_vertical'].notnull()]
-df_politics = df_politics[df_politics['subject_vertical'].str.contains('Politics')]
-print(df_politics.head(20))
-print('Number of Total Students in Politics vertical:', len(df_politics))
-
-##Create figure object
-fig_politics = plotly.express.scatter(data_frame=df_politics,
-                                     x=df_politics['final_mark'],
-                                     y=df_politics['number_of_posts'],
-                                     title='Politics, Economics and International Relations: Number of Posts by Final Grade',
-                                     trendline='ols',
-                                     trendline_color_override='red',
-                                     hover_data=['number_of_posts',
-                                                 'final_mark'],
-                                     labels={'number_of_posts': 'Number of Posts',
-                                             'final_mark': 'Final Mark'})
-import plotly.graph_objects
-##Save figure
-fig_politics.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_politics.png')
-
-##Plot: Finance subject vertical
-##Create subset dataframe
-df_finance = df_extract[df_extract['subject_vertical'].notnull()]
-df_finance = df_finance[df_finance['subject_vertical'].str.contains('Finance')]
-print(df_finance.head(20))
-print('Number of Total Students in Finance vertical:', len(df_finance))
-
-##Create figure object
-fig_finance = plotly.express.scatter(data_frame=df_finance,
-                                     x=df_finance['final_mark'],
-                                     y=df_finance['number_of_posts'],
-                                     title='Finance: Number of Posts by Final Grade',
-                                     trendline='ols',
-                                     trendline_color_override='red')
-
-fig_finance.show()
-
-##Save figure
-fig_finance.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_finance.png')
+##The Politics and Finance verticals keep the file names of the original report, every other vertical is named after itself
+sub_vertical_file_names = {'Politics, Economics and International Relations': 'fig_politics.png',
+                           'Finance': 'fig_finance.png'}
+
+def sub_vertical_file_name(group):
+    return sub_vertical_file_names.get(str(group), scatter_report.figure_file_name(group))
+
+@analysis.stage(inputs=['df_extract'], outputs=['df_corr_sub_vertical'])
+def sub_vertical_level(df_extract):
+    ##Calculate correlation for each course abbreviation
+    df_corr_sub_vertical = grouped_correlation.grouped_pearson(df_extract, 'subject_vertical', 'final_mark', 'number_of_posts')
+
+    return df_corr_sub_vertical
+
+@analysis.stage(inputs=['df_corr_sub_vertical'], memoize=False)
+def sub_vertical_report(df_corr_sub_vertical):
+    print(df_corr_sub_vertical.head(20))
+
+@analysis.stage(inputs=['df_extract'], memoize=False)
+def sub_vertical_plots(df_extract):
+    ##Plot: every subject vertical
+    scatter_report.scatter_report(df_extract,
+                                  'subject_vertical',
+                                  '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis',
+                                  hover_data=['number_of_posts',
+                                              'final_mark'],
+                                  file_name=sub_vertical_file_name)
 
 ################################################################################################################################################################
 #6.) CORRELATION CALCULATIONS (COURSE TYPE GROUPS)
 
-##Calculate correlation for each course abbreviation
-df_corr_course_type = pandas.DataFrame(df_extract.groupby('course_type')[['final_mark', 'number_of_posts']].corr().iloc[0::2,-1]).reset_index()
+@analysis.stage(inputs=['df_extract'], outputs=['df_corr_course_type', 'df_politics'])
+def course_type_level(df_extract):
+    ##Calculate correlation for each course abbreviation
+    df_corr_course_type = grouped_correlation.grouped_pearson(df_extract, 'course_type', 'final_mark', 'number_of_posts')
 
-##Edit resulting dataframe
-df_corr_course_type = df_corr_course_type[['course_type', 'number_of_posts']]
-df_corr_course_type = df_corr_course_type.rename(columns={'number_of_posts': 'r_squared'})
-df_corr_course_type['r_squared'] = df_corr_course_type['r_squared'] ** 2
-df_corr_course_type = df_corr_course_type.sort_values(by='r_squared', ascending=False)
-print(df_corr_course_type.head(20))
+    ##Plot: Politics subject vertical
+    ##Create subset dataframe
+    df_politics = df_extract[df_extract['subject_vertical'].notnull()]
+    df_politics = df_politics[df_politics['subject_vertical'].str.contains('Politics')]
 
-##Plot: Politics subject vertical
-##Create subset dataframe
-df_politics = df_extract[df_extract['subject_vertical'].notnull()]
-df_politics = df_politics[df_politics['subject_vertical'].str.contains('Politics')]
-print(df_politics.head(20))
-print('Number of Total Students in Politics vertical:', len(df_politics))
+    return df_corr_course_type, df_politics
+
+@analysis.stage(inputs=['df_corr_course_type', 'df_politics'], memoize=False)
+def course_type_report(df_corr_course_type, df_politics):
+    print(df_corr_course_type.head(20))
+    print(df_politics.head(20))
+    print('Number of Total Students in Politics vertical:', len(df_politics))
 
 ################################################################################################################################################################
 #5.) DRIVER ANALYSIS
 ##5.1) Extract data from database
 
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
-
 ##Sql query
-sql = """
+driver_sql = """
 SELECT CONCAT(B.university_code, '-', B.course_abbreviation) AS course_abbreviation,
        B.course_type,
        B.subject_vertical,
@@ -495,15 +424,11 @@ LEFT JOIN (SELECT university AS la_university,
                   COUNT(DISTINCT user_id) AS number_of_stakeholders,
                   SUM(all_posts) AS stakeholder_posts,
                   SUM(nr_of_likes) AS stakeholder_likes
-           FROM rdw_la.vw_master_alluser_activities
+           FROM rdw_la.stg_forum_activity
            WHERE activity_type IN ('hsuforum', 'forum')
            AND user_role IN ('tutor', 'headtutor')
-           AND (LOWER(activity_name) LIKE '%discussion forum%' OR LOWER(activity_name) LIKE '%class-wide%')
-           AND LOWER(activity_name) NOT LIKE '%small-group%'
-           AND LOWER(activity_name) NOT LIKE '%small group%'
-           AND LOWER(activity_name) NOT LIKE '%graded%'
-           AND LOWER(activity_name) NOT LIKE '%practical exercise%'
-           AND LOWER(activity_name) NOT LIKE '%final assignment%'
+           AND (is_discussion_forum OR is_class_wide_hyphenated)
+           AND NOT is_excluded
            GROUP BY university,
                     CONCAT(SPLIT_PART(course_name, '-', 1), '-', SPLIT_PART(course_name, '-', 2))) E ON E.la_university = D.la_university
                                                                               AND E.course_abbreviation = CONCAT(B.university_code, '-', B.course_abbreviation)
@@ -511,15 +436,11 @@ LEFT JOIN (SELECT university AS la_university,
                   CONCAT(SPLIT_PART(course_name, '-', 1), '-', SPLIT_PART(course_name, '-', 2)) AS course_abbreviation,
                   SUM(all_posts) AS student_posts,
                   SUM(nr_of_likes) AS student_likes
-           FROM rdw_la.vw_master_alluser_activities
+           FROM rdw_la.stg_forum_activity
            WHERE activity_type IN ('hsuforum', 'forum')
            AND user_role IN ('student')
-           AND (LOWER(activity_name) LIKE '%discussion forum%' OR LOWER(activity_name) LIKE '%class-wide%')
-           AND LOWER(activity_name) NOT LIKE '%small-group%'
-           AND LOWER(activity_name) NOT LIKE '%small group%'
-           AND LOWER(activity_name) NOT LIKE '%graded%'
-           AND LOWER(activity_name) NOT LIKE '%practical exercise%'
-           AND LOWER(activity_name) NOT LIKE '%final assignment%'
+           AND (is_discussion_forum OR is_class_wide_hyphenated)
+           AND NOT is_excluded
            GROUP BY university,
                     CONCAT(SPLIT_PART(course_name, '-', 1), '-', SPLIT_PART(course_name, '-', 2))) F ON F.la_university = D.la_university
                                                                               AND F.course_abbreviation = CONCAT(B.university_code, '-', B.course_abbreviation)
@@ -537,142 +458,167 @@ GROUP BY CONCAT(B.university_code, '-', B.course_abbreviation),
          E.number_of_stakeholders
 """
 
+##Column types
+df_driver_extract_schema = {'course_abbreviation': 'category',
+                            'course_type': 'category',
+                            'subject_vertical': 'category',
+                            'stakeholder_posts': 'float32',
+                            'stakeholder_likes': 'float32',
+                            'student_posts': 'float32',
+                            'student_likes': 'float32',
+                            'number_of_stakeholders': 'Int32',
+                            'number_of_presentations': 'Int32',
+                            'number_of_students': 'int32',
+                            'number_of_aspirants': 'int32',
+                            'number_of_dreamers': 'int32',
+                            'number_of_leaders': 'int32',
+                            'number_of_pros': 'int32',
+                            'number_of_realists': 'int32',
+                            'number_of_reinventors': 'int32',
+                            'average_course_price': 'float32',
+                            'average_course_grade': 'float32'}
+
 ##Create pandas dataframe
-df_driver_extract = pandas.read_sql_query(sql, rdw_conn)
+@analysis.stage(inputs=['staging_version'], outputs=['df_driver_extract_raw'], memoize=False)
+def driver_extract(staging_version):
+    return extract_cache.read_sql(driver_sql, name='df_driver_extract', source_version=extract_cache.snapshot_version(staging_version), schema=df_driver_extract_schema)
 
 ##5.2) Clean data
-
-##Drop columns with nulls
-df_driver_extract = df_driver_extract.dropna(axis=0, how='any')
-print(df_driver_extract)
-
-##Clean data
-##Divide customer tribe by number of students
-df_driver_extract['proportion_aspirants'] = df_driver_extract['number_of_aspirants'] / df_driver_extract['number_of_students'] * 100
-df_driver_extract['proportion_dreamers'] = df_driver_extract['number_of_dreamers'] / df_driver_extract['number_of_students'] * 100
-df_driver_extract['proportion_leaders'] = df_driver_extract['number_of_leaders'] / df_driver_extract['number_of_students'] * 100
-df_driver_extract['proportion_pros'] = df_driver_extract['number_of_pros'] / df_driver_extract['number_of_students'] * 100
-df_driver_extract['proportion_realists'] = df_driver_extract['number_of_realists'] / df_driver_extract['number_of_students'] * 100
-df_driver_extract['proportion_reinventors'] = df_driver_extract['number_of_reinventors'] / df_driver_extract['number_of_students'] * 100
-
-##Divide posts and likes by number of stakeholders
-df_driver_extract['posts_per_stakeholder'] = df_driver_extract['stakeholder_posts'] / df_driver_extract['number_of_stakeholders']
-df_driver_extract['likes_per_stakeholder'] = df_driver_extract['stakeholder_likes'] / df_driver_extract['number_of_stakeholders']
-
-##Divide student posts and likes by number of students
-df_driver_extract['posts_per_student'] = df_driver_extract['student_posts'] / df_driver_extract['number_of_students']
-df_driver_extract['likes_per_student'] = df_driver_extract['student_likes'] / df_driver_extract['number_of_students']
-
-##Select columns for dataframe
-df_driver_extract = df_driver_extract[['course_abbreviation',
-                                       'course_type',
-                                       'subject_vertical',
-                                       'average_course_price',
-                                       'average_course_grade',
-                                       'posts_per_stakeholder',
-                                       'likes_per_stakeholder',
-                                       'posts_per_student',
-                                       'likes_per_student',
-                                       'proportion_aspirants',
-                                       'proportion_dreamers',
-                                       'proportion_leaders',
-                                       'proportion_pros',
-                                       'proportion_realists',
-                                       'proportion_reinventors']]
-
-##View dataframe
-print(df_driver_extract.head(20))
-
-##Join with corr courses dataframe
-df_driver = pandas.merge(df_corr_courses, df_driver_extract, on='course_abbreviation')
-
-##Drop course abbreviation
-df_driver.drop(['course_abbreviation'], axis=1, inplace=True)
-df_driver = df_driver.fillna(0)
-
-##Rename R-squared to performance measure
-df_driver = df_driver.rename(columns={'r_squared': 'performance_measure'})
-print(df_driver.head(20))
-
-##5.3) Calculate correlations with the performance measure
-
-##Create a dataframe with the correlations with the performance measure
-df_corr_perf_measure = pandas.DataFrame(df_driver.corr())
-print(df_corr_perf_measure.head(20))
-
-##Clean data and transform to R-squared value
-df_corr_perf_measure = df_corr_perf_measure.reset_index()
-df_corr_perf_measure = df_corr_perf_measure[['index', 'performance_measure']]
-df_corr_perf_measure['performance_measure'] = df_corr_perf_measure['performance_measure'] ** 2
-df_corr_perf_measure = df_corr_perf_measure.rename(columns={'index': 'drivers',
-                                                            'performance_measure': 'r_squared'})
-print(df_corr_perf_measure)
-
-##5.4) Plot strong/weak correlations against performance measure
-##Plot the strong/weak correlations
-##Create figure object
-fig_pros_vs_perf_measure = plotly.express.scatter(data_frame=df_driver,
-                                                  x=df_driver['proportion_pros'],
-                                                  y=df_driver['performance_measure'],
-                                                  title='Proportion of Pros by Performance Measure',
-                                                  trendline='ols',
-                                                  trendline_color_override='red',
-                                                  hover_data=['proportion_pros',
-                                                              'performance_measure'],
-                                                  labels={'proportion_pros': 'Proportion of Pros',
-                                                          'performance_measure': 'Performance Measure'})
-
-fig_pros_vs_perf_measure.show()
-
-##Save figure
-fig_pros_vs_perf_measure.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_pros_vs_perf_measure.png')
-
-##Create figure object
-fig_dreamers_vs_perf_measure = plotly.express.scatter(data_frame=df_driver,
-                                                      x=df_driver['proportion_dreamers'],
+@analysis.stage(inputs=['df_driver_extract_raw', 'df_corr_courses'], outputs=['df_driver', 'df_corr_perf_measure'])
+def driver_analysis(df_driver_extract_raw, df_corr_courses):
+
+    ##Drop columns with nulls
+    df_driver_extract = df_driver_extract_raw.dropna(axis=0, how='any')
+    print(df_driver_extract)
+
+    ##Clean data
+    ##Divide customer tribe by number of students
+    df_driver_extract['proportion_aspirants'] = df_driver_extract['number_of_aspirants'] / df_driver_extract['number_of_students'] * 100
+    df_driver_extract['proportion_dreamers'] = df_driver_extract['number_of_dreamers'] / df_driver_extract['number_of_students'] * 100
+    df_driver_extract['proportion_leaders'] = df_driver_extract['number_of_leaders'] / df_driver_extract['number_of_students'] * 100
+    df_driver_extract['proportion_pros'] = df_driver_extract['number_of_pros'] / df_driver_extract['number_of_students'] * 100
+    df_driver_extract['proportion_realists'] = df_driver_extract['number_of_realists'] / df_driver_extract['number_of_students'] * 100
+    df_driver_extract['proportion_reinventors'] = df_driver_extract['number_of_reinventors'] / df_driver_extract['number_of_students'] * 100
+
+    ##Divide posts and likes by number of stakeholders
+    df_driver_extract['posts_per_stakeholder'] = df_driver_extract['stakeholder_posts'] / df_driver_extract['number_of_stakeholders']
+    df_driver_extract['likes_per_stakeholder'] = df_driver_extract['stakeholder_likes'] / df_driver_extract['number_of_stakeholders']
+
+    ##Divide student posts and likes by number of students
+    df_driver_extract['posts_per_student'] = df_driver_extract['student_posts'] / df_driver_extract['number_of_students']
+    df_driver_extract['likes_per_student'] = df_driver_extract['student_likes'] / df_driver_extract['number_of_students']
+
+    ##Select columns for dataframe
+    df_driver_extract = df_driver_extract[['course_abbreviation',
+                                           'course_type',
+                                           'subject_vertical',
+                                           'average_course_price',
+                                           'average_course_grade',
+                                           'posts_per_stakeholder',
+                                           'likes_per_stakeholder',
+                                           'posts_per_student',
+                                           'likes_per_student',
+                                           'proportion_aspirants',
+                                           'proportion_dreamers',
+                                           'proportion_leaders',
+                                           'proportion_pros',
+                                           'proportion_realists',
+                                           'proportion_reinventors']]
+
+    ##View dataframe
+    print(df_driver_extract.head(20))
+
+    ##Join with corr courses dataframe
+    df_driver = pandas.merge(df_corr_courses[['course_abbreviation', 'r_squared']], df_driver_extract, on='course_abbreviation')
+
+    ##Drop course abbreviation
+    df_driver.drop(['course_abbreviation'], axis=1, inplace=True)
+    df_driver = extract_schema.fill_missing(df_driver, 0)
+
+    ##Rename R-squared to performance measure
+    df_driver = df_driver.rename(columns={'r_squared': 'performance_measure'})
+
+    ##5.3) Calculate correlations with the performance measure
+
+    ##Create a dataframe with the correlations with the performance measure
+    df_corr_perf_measure = pandas.DataFrame(df_driver.corr())
+    print(df_corr_perf_measure.head(20))
+
+    ##Clean data and transform to R-squared value
+    df_corr_perf_measure = df_corr_perf_measure.reset_index()
+    df_corr_perf_measure = df_corr_perf_measure[['index', 'performance_measure']]
+    df_corr_perf_measure['performance_measure'] = df_corr_perf_measure['performance_measure'] ** 2
+    df_corr_perf_measure = df_corr_perf_measure.rename(columns={'index': 'drivers',
+                                                                'performance_measure': 'r_squared'})
+
+    return df_driver, df_corr_perf_measure
+
+@analysis.stage(inputs=['df_driver', 'df_corr_perf_measure'], memoize=False)
+def driver_report(df_driver, df_corr_perf_measure):
+    print(df_driver.head(20))
+    print(df_corr_perf_measure)
+
+@analysis.stage(inputs=['df_driver'], memoize=False)
+def driver_plots(df_driver):
+    ##5.4) Plot strong/weak correlations against performance measure
+    ##Plot the strong/weak correlations
+    ##Create figure object
+    fig_pros_vs_perf_measure = plotly.express.scatter(data_frame=df_driver,
+                                                      x=df_driver['proportion_pros'],
                                                       y=df_driver['performance_measure'],
-                                                      title='Proportion of Dreamers by Performance Measure',
+                                                      title='Proportion of Pros by Performance Measure',
                                                       trendline='ols',
                                                       trendline_color_override='red',
-                                                      hover_data=['proportion_dreamers',
+                                                      hover_data=['proportion_pros',
                                                                   'performance_measure'],
-                                                      labels={'proportion_dreamers': 'Proportion of Dreamers',
+                                                      labels={'proportion_pros': 'Proportion of Pros',
                                                               'performance_measure': 'Performance Measure'})
 
-fig_dreamers_vs_perf_measure.show()
-
-##Save figure
-fig_dreamers_vs_perf_measure.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_dreamers_vs_perf_measure.png')
-
-##Create figure object
-fig_posts_vs_perf_measure = plotly.express.scatter(data_frame=df_driver,
-                                                   x=df_driver['posts_per_student'],
-                                                   y=df_driver['performance_measure'],
-                                                   title='Student Posts by Performance Measure',
-                                                   trendline='ols',
-                                                   trendline_color_override='red',
-                                                   hover_data=['posts_per_student',
-                                                               'performance_measure'],
-                                                   labels={'posts_per_student': 'Posts per Student',
-                                                           'performance_measure': 'Performance Measure'})
-
-fig_posts_vs_perf_measure.show()
-
-##Save figure
-fig_posts_vs_perf_measure.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_posts_vs_perf_measure.png')
+    fig_pros_vs_perf_measure.show()
+
+    ##Save figure
+    figure_export.write_image(fig_pros_vs_perf_measure, '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_pros_vs_perf_measure.png')
+
+    ##Create figure object
+    fig_dreamers_vs_perf_measure = plotly.express.scatter(data_frame=df_driver,
+                                                          x=df_driver['proportion_dreamers'],
+                                                          y=df_driver['performance_measure'],
+                                                          title='Proportion of Dreamers by Performance Measure',
+                                                          trendline='ols',
+                                                          trendline_color_override='red',
+                                                          hover_data=['proportion_dreamers',
+                                                                      'performance_measure'],
+                                                          labels={'proportion_dreamers': 'Proportion of Dreamers',
+                                                                  'performance_measure': 'Performance Measure'})
+
+    fig_dreamers_vs_perf_measure.show()
+
+    ##Save figure
+    figure_export.write_image(fig_dreamers_vs_perf_measure, '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_dreamers_vs_perf_measure.png')
+
+    ##Create figure object
+    fig_posts_vs_perf_measure = plotly.express.scatter(data_frame=df_driver,
+                                                       x=df_driver['posts_per_student'],
+                                                       y=df_driver['performance_measure'],
+                                                       title='Student Posts by Performance Measure',
+                                                       trendline='ols',
+                                                       trendline_color_override='red',
+                                                       hover_data=['posts_per_student',
+                                                                   'performance_measure'],
+                                                       labels={'posts_per_student': 'Posts per Student',
+                                                               'performance_measure': 'Performance Measure'})
+
+    fig_posts_vs_perf_measure.show()
+
+    ##Save figure
+    figure_export.write_image(fig_posts_vs_perf_measure, '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_posts_vs_perf_measure.png')
 
 ################################################################################################################################################################
 #6.) ADDITIONAL NPS BY FINAL MARK
 
 ##6.1) Extract data
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
-
 ##Sql query
-sql = """
+nps_sql = """
 SELECT B.university,
        CONCAT(B.university_code, '-', B.course_abbreviation) AS course_abbreviation,
        A.vle_user_id,
@@ -698,210 +644,97 @@ AND A.final_mark IS NOT NULL
 AND E.npsscore IS NOT NULL
 """
 
-##Create pandas dataframe
-df_nps = pandas.read_sql_query(sql, rdw_conn)
-print(df_nps.head(20))
-
-##6.2) Clean data
-
-##Drop columns with nulls
-df_nps = df_nps.dropna(axis=0, how='any')
-print(df_nps.head(20))
-
-##6.3) Calculate correlation for different courses
-
-##Calculate correlation for each course abbreviation
-df_corr_nps = pandas.DataFrame(df_nps.groupby('course_abbreviation')[['final_mark', 'npsscore']].corr().iloc[0::2,-1]).reset_index()
-df_corr_nps = df_corr_nps[['course_abbreviation', 'npsscore']]
-df_corr_nps = df_corr_nps.rename(columns={'npsscore': 'r_squared'})
-df_corr_nps['r_squared'] = df_corr_nps['r_squared'] ** 2
-df_corr_nps = df_corr_nps.sort_values(by='r_squared', ascending=False)
-print(df_corr_nps.head(20))
-print(df_corr_nps.tail(20))
-
-##6.4) Plot nps score by final grade
-df_tec_lea = df_nps[df_nps['course_abbreviation'].str.contains('TEC-LEA')]
-
-##Create figure object
-fig_tec_lea = plotly.express.scatter(data_frame=df_nps,
-                                     x=df_nps['npsscore'],
-                                     y=df_nps['final_mark'],
-                                     title='NPS Score by Final Mark',
-                                     trendline='ols',
-                                     trendline_color_override='red',
-                                     hover_data=['final_mark',
-                                                 'npsscore',
-                                                 'course_abbreviation'],
-                                     labels={'final_mark': 'Average Final Mark',
-                                             'npsscore': 'NPS Score',
-                                             'course_abbreviation': 'Course Abbreviation'}).show()
-
-##Save figure
-fig_tec_lea.write_image('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_tec_lea.png')
-
-
-################################################################################################################################################################
-#7.) MODULE LEVEL ANALYSIS
-
-##7.1) Extract data
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
-
-##Sql query
-sql = """
-SELECT A.university AS la_university,
-       A.course_name AS presentation_abbreviation,
-       A.course_id AS vle_course_id,
-       A.course_module_id,
-       A.module_name,
-       A.activity_name,
-       A.user_id AS vle_user_id,
-       A.user_role,
-       CONCAT(A.firstname, ' ', A.lastname) AS student_name,
-       B.module_grade,
-       SUM(all_posts) AS number_of_posts
-FROM rdw_la.vw_master_alluser_activities A
-LEFT JOIN rdw_la.vw_module_grades B ON B.user_id = A.user_id
-                                    AND B.course_id = A.course_id
-                                    AND B.course_module_id = A.course_module_id
-WHERE A.activity_type IN ('hsuforum', 'forum')
-AND A.user_role = 'student'
-AND (LOWER(A.activity_name) LIKE '%discussion forum%' OR LOWER(A.activity_name) LIKE '%class-wide%')
-AND LOWER(A.activity_name) NOT LIKE '%small-group%'
-AND LOWER(A.activity_name) NOT LIKE '%small group%'
-AND LOWER(A.activity_name) NOT LIKE '%graded%'
-AND LOWER(A.activity_name) NOT LIKE '%practical exercise%'
-AND LOWER(A.activity_name) NOT LIKE '%final assignment%'
-AND LOWER(A.activity_name) NOT LIKE '%orientation%'
-AND B.module_grade IS NOT NULL
-GROUP BY A.university,
-         A.course_name,
-         A.course_id,
-         A.course_module_id,
-         A.module_name,
-         A.activity_name,
-         A.user_id,
-         A.user_role,
-         CONCAT(A.firstname, ' ', A.lastname),
-         B.module_grade;
-"""
+##Column types
+df_nps_schema = {'university': 'category',
+                 'course_abbreviation': 'category',
+                 'vle_user_id': 'int64',
+                 'final_mark': 'float32',
+                 'npsscore': 'float32'}
 
 ##Create pandas dataframe
-df_modules = pandas.read_sql_query(sql, rdw_conn)
-
-##Concatenate two strings
-df_modules['course_module'] = df_modules['presentation_abbreviation'].map(str) + ' ' + df_modules['module_name']
-
-##2.2) Clean data
-##Clean df_extract
-df_modules = df_modules.fillna(0)
-df_modules['module_grade'].values[df_modules['module_grade'].values > 100] = 100
-print(df_modules.head(20))
-print('Number of Total Students:', len(df_modules))
+@analysis.stage(outputs=['df_nps_raw'], memoize=False)
+def nps_extract():
+    return extract_cache.read_sql(nps_sql, name='df_nps', schema=df_nps_schema)
 
-##Calculate correlation for each course abbreviation
-df_corr_modules = pandas.DataFrame(df_modules.groupby('course_module')[['module_grade', 'number_of_posts']].corr().iloc[0::2,-1]).reset_index()
+@analysis.stage(inputs=['df_nps_raw'], outputs=['df_corr_nps', 'df_nps'])
+def nps_analysis(df_nps_raw):
+    print(df_nps_raw.head(20))
 
-##Edit resulting dataframe
-df_corr_modules = df_corr_modules[['course_module', 'number_of_posts']]
-df_corr_modules = df_corr_modules.rename(columns={'number_of_posts': 'r_squared'})
-df_corr_modules['r_squared'] = df_corr_modules['r_squared'] ** 2
-df_corr_modules = df_corr_modules.sort_values(by='r_squared', ascending=False)
+    ##6.2) Clean data
 
+    ##Drop columns with nulls
+    df_nps = df_nps_raw.dropna(axis=0, how='any')
+    print(df_nps.head(20))
 
-df_corr_modules.to_csv('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/test.csv')
+    ##6.3) Calculate correlation for different courses
 
-################################################################################################################################################################
-##10.) PRESENTATION MODULE LEVEL
+    ##Calculate correlation for each course abbreviation
+    df_corr_nps = grouped_correlation.grouped_pearson(df_nps, 'course_abbreviation', 'final_mark', 'npsscore')
 
-##Presentation module level
-##First do at student level to calculate correlations
-##Then join correlations back to presentation module level
+    return df_corr_nps, df_nps
 
-##10.1) Base table
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
+@analysis.stage(inputs=['df_corr_nps'], memoize=False)
+def nps_report(df_corr_nps):
+    print(df_corr_nps.head(20))
+    print(df_corr_nps.tail(20))
 
-##Sql query
-sql = """
-SELECT A.university AS la_university,
-       A.course_name AS presentation_abbreviation,
-       A.course_id AS vle_course_id,
-       A.course_module_id,
-       A.module_name,
-       ROUND(AVG(B.module_grade), 2) AS average_grade,
-       SUM(all_posts) AS number_of_posts
-FROM rdw_la.vw_master_alluser_activities A
-LEFT JOIN rdw_la.vw_module_grades B ON B.user_id = A.user_id
-                                    AND B.course_id = A.course_id
-                                    AND B.course_module_id = A.course_module_id
-WHERE A.activity_type IN ('hsuforum', 'forum')
-AND A.user_role = 'student'
-AND (LOWER(A.activity_name) LIKE '%forum%' OR LOWER(A.activity_name) LIKE '%discussion%')
-AND LOWER(A.activity_name) NOT LIKE '%small-group%'
-AND LOWER(A.activity_name) NOT LIKE '%small group%'
-AND LOWER(A.activity_name) NOT LIKE '%graded%'
-AND LOWER(A.activity_name) NOT LIKE '%practical exercise%'
-AND LOWER(A.activity_name) NOT LIKE '%final assignment%'
-AND LOWER(A.activity_name) NOT LIKE '%orientation%'
-AND B.module_grade IS NOT NULL
-GROUP BY A.university,
-         A.course_name,
-         A.course_id,
-         A.course_module_id,
-         A.module_name;
-"""
+@analysis.stage(inputs=['df_nps'], memoize=False)
+def nps_plots(df_nps):
+    ##6.4) Plot nps score by final grade
+    df_tec_lea = df_nps[df_nps['course_abbreviation'].str.contains('TEC-LEA')]
 
-##Create pandas dataframe
-df_pres_mod_base = pandas.read_sql_query(sql, rdw_conn)
-print(df_pres_mod_base.head(20))
+    ##Create figure object
+    fig_tec_lea = plotly.express.scatter(data_frame=df_nps,
+                                         x=df_nps['npsscore'],
+                                         y=df_nps['final_mark'],
+                                         title='NPS Score by Final Mark',
+                                         trendline='ols',
+                                         trendline_color_override='red',
+                                         hover_data=['final_mark',
+                                                     'npsscore',
+                                                     'course_abbreviation'],
+                                         labels={'final_mark': 'Average Final Mark',
+                                                 'npsscore': 'NPS Score',
+                                                 'course_abbreviation': 'Course Abbreviation'})
 
-##Concatenate two strings
-df_pres_mod_base['presentation_module'] = df_pres_mod_base['presentation_abbreviation'].map(str) + ' ' + df_pres_mod_base['module_name']
-print(df_pres_mod_base.head(20))
+    fig_tec_lea.show()
 
-##Select specific columns
-df_pres_mod_base = df_pres_mod_base[['presentation_module', 'number_of_posts', 'average_grade']]
-print(df_pres_mod_base.head(20))
+    ##Save figure
+    figure_export.write_image(fig_tec_lea, '/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/fig_tec_lea.png')
 
-##Correlation creation
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
+################################################################################################################################################################
+#7.) MODULE LEVEL ANALYSIS
 
+##7.1) Extract data
+##Single student by module extract shared by sections 7, 10 and 11
+##Activity filters and grouping levels of each section are applied locally
 ##Sql query
-sql = """
+module_activity_sql = """
 SELECT A.university AS la_university,
        A.course_name AS presentation_abbreviation,
+       CONCAT(SPLIT_PART(A.course_name, '-', 1), '-', SPLIT_PART(A.course_name, '-', 2)) AS course_abbreviation,
        A.course_id AS vle_course_id,
        A.course_module_id,
+       A.module_nr_from_name,
        A.module_name,
+       A.activity_name,
+       A.is_discussion_forum,
+       A.is_class_wide_hyphenated,
+       A.is_forum,
        A.user_id AS vle_user_id,
-       A.user_role,
        CONCAT(A.firstname, ' ', A.lastname) AS student_name,
        B.module_grade,
+       COUNT(*) AS number_of_rows,
        SUM(all_posts) AS number_of_posts
-FROM rdw_la.vw_master_alluser_activities A
+FROM rdw_la.stg_forum_activity A
 LEFT JOIN rdw_la.vw_module_grades B ON B.user_id = A.user_id
                                     AND B.course_id = A.course_id
                                     AND B.course_module_id = A.course_module_id
 WHERE A.activity_type IN ('hsuforum', 'forum')
 AND A.user_role = 'student'
-AND (LOWER(A.activity_name) LIKE '%forum%' OR LOWER(A.activity_name) LIKE '%discussion%')
-AND LOWER(A.activity_name) NOT LIKE '%small-group%'
-AND LOWER(A.activity_name) NOT LIKE '%small group%'
-AND LOWER(A.activity_name) NOT LIKE '%graded%'
-AND LOWER(A.activity_name) NOT LIKE '%practical exercise%'
-AND LOWER(A.activity_name) NOT LIKE '%final assignment%'
-AND LOWER(A.activity_name) NOT LIKE '%orientation%'
+AND (A.is_forum OR A.is_discussion_forum OR A.is_class_wide_hyphenated)
+AND NOT A.is_excluded
+AND NOT A.is_orientation_activity
 AND B.module_grade IS NOT NULL
 GROUP BY A.university,
          A.course_name,
@@ -909,148 +742,227 @@ GROUP BY A.university,
          A.course_module_id,
          A.module_nr_from_name,
          A.module_name,
+         A.activity_name,
+         A.is_discussion_forum,
+         A.is_class_wide_hyphenated,
+         A.is_forum,
          A.user_id,
-         A.user_role,
          CONCAT(A.firstname, ' ', A.lastname),
          B.module_grade;
 """
 
-##Create pandas dataframe
-df_pres_mod = pandas.read_sql_query(sql, rdw_conn)
-
-##Concatenate two strings
-df_pres_mod['presentation_module'] = df_pres_mod['presentation_abbreviation'].map(str) + ' ' + df_pres_mod['module_name']
-
-##Clean df_extract
-df_pres_mod = df_pres_mod.fillna(0)
-df_pres_mod['module_grade'].values[df_pres_mod['module_grade'].values > 100] = 100
-print(df_pres_mod.head(20))
+##Column types
+df_module_activity_schema = {'la_university': 'category',
+                             'presentation_abbreviation': 'category',
+                             'course_abbreviation': 'category',
+                             'vle_course_id': 'int64',
+                             'course_module_id': 'int64',
+                             'module_nr_from_name': 'category',
+                             'module_name': 'category',
+                             'activity_name': 'category',
+                             'vle_user_id': 'int64',
+                             'student_name': 'category',
+                             'module_grade': 'float32',
+                             'number_of_rows': 'int32',
+                             'number_of_posts': 'float32'}
 
-##Calculate correlation for each course abbreviation
-df_corr_pres_mod = pandas.DataFrame(df_pres_mod.groupby('presentation_module')[['module_grade', 'number_of_posts']].corr().iloc[0::2,-1]).reset_index()
-
-##Edit resulting dataframe
-df_corr_pres_mod = df_corr_pres_mod[['presentation_module', 'number_of_posts']]
-df_corr_pres_mod = df_corr_pres_mod.rename(columns={'number_of_posts': 'r_squared'})
-df_corr_pres_mod['r_squared'] = df_corr_pres_mod['r_squared'] ** 2
-df_corr_pres_mod = df_corr_pres_mod.sort_values(by='r_squared', ascending=False)
-print(df_corr_pres_mod.head(20))
+##Create pandas dataframe
+@analysis.stage(inputs=['staging_version'], outputs=['df_module_activity'], memoize=False)
+def module_extract(staging_version):
+    return extract_cache.read_sql(module_activity_sql, name='df_module_activity', source_version=extract_cache.snapshot_version(staging_version), schema=df_module_activity_schema)
+
+@analysis.stage(inputs=['df_module_activity'], outputs=['df_corr_modules', 'number_of_module_students'])
+def module_level(df_module_activity):
+    print(df_module_activity.head(20))
+
+    ##Discussion forum and class-wide activities
+    module_activity_mask = module_activity.activity_mask(df_module_activity, module_activity.MODULE_ACTIVITY_FLAGS)
+
+    ##7.2) Student level data
+    df_modules = module_activity.student_level(df_module_activity,
+                                               ['la_university',
+                                                'presentation_abbreviation',
+                                                'vle_course_id',
+                                                'course_module_id',
+                                                'module_name',
+                                                'activity_name',
+                                                'vle_user_id',
+                                                'student_name',
+                                                'module_grade'],
+                                               module_activity_mask)
+
+    ##Concatenate two strings
+    df_modules['course_module'] = df_modules['presentation_abbreviation'].astype(str) + ' ' + df_modules['module_name'].astype(str)
+
+    ##Clean data
+    df_modules = extract_schema.fill_missing(df_modules, 0)
+    df_modules['module_grade'].values[df_modules['module_grade'].values > 100] = 100
+    print(df_modules.head(20))
+
+    ##Calculate correlation for each course abbreviation
+    df_corr_modules = grouped_correlation.grouped_pearson(df_modules, 'course_module', 'module_grade', 'number_of_posts')
+
+    return df_corr_modules, len(df_modules)
+
+@analysis.stage(inputs=['number_of_module_students'], memoize=False)
+def module_report(number_of_module_students):
+    print('Number of Total Students:', number_of_module_students)
+
+@analysis.stage(inputs=['df_corr_modules'], memoize=False)
+def module_export(df_corr_modules):
+    ##Export to test.csv
+    df_corr_modules.to_csv('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/test.csv')
 
-##Join to base table
-df_pres_mod_final = pandas.merge(left=df_pres_mod_base, right=df_corr_pres_mod, how='inner')
-print(df_pres_mod_final.head(20))
+################################################################################################################################################################
+##10.) PRESENTATION MODULE LEVEL
 
-##Export to df_corr_sub_vertical
-df_pres_mod_final.to_csv('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/df_pres_mod_final.csv')
+@analysis.stage(inputs=['df_module_activity'], outputs=['df_pres_mod_final'])
+def presentation_module_level(df_module_activity):
+    ##Forum activities
+    forum_activity_mask = module_activity.activity_mask(df_module_activity, module_activity.FORUM_ACTIVITY_FLAGS)
+
+    ##Presentation module level
+    ##First do at student level to calculate correlations
+    ##Then join correlations back to presentation module level
+
+    ##10.1) Base table
+    df_pres_mod_base = module_activity.module_level(df_module_activity,
+                                                    ['la_university',
+                                                     'presentation_abbreviation',
+                                                     'vle_course_id',
+                                                     'course_module_id',
+                                                     'module_name'],
+                                                    forum_activity_mask)
+    print(df_pres_mod_base.head(20))
+
+    ##Concatenate two strings
+    df_pres_mod_base['presentation_module'] = df_pres_mod_base['presentation_abbreviation'].astype(str) + ' ' + df_pres_mod_base['module_name'].astype(str)
+    print(df_pres_mod_base.head(20))
+
+    ##Select specific columns
+    df_pres_mod_base = df_pres_mod_base[['presentation_module', 'number_of_posts', 'average_grade']]
+    print(df_pres_mod_base.head(20))
+
+    ##Correlation creation
+    df_pres_mod = module_activity.student_level(df_module_activity,
+                                                ['la_university',
+                                                 'presentation_abbreviation',
+                                                 'vle_course_id',
+                                                 'course_module_id',
+                                                 'module_nr_from_name',
+                                                 'module_name',
+                                                 'vle_user_id',
+                                                 'student_name',
+                                                 'module_grade'],
+                                                forum_activity_mask)
+
+    ##Concatenate two strings
+    df_pres_mod['presentation_module'] = df_pres_mod['presentation_abbreviation'].astype(str) + ' ' + df_pres_mod['module_name'].astype(str)
+
+    ##Clean df_extract
+    df_pres_mod = extract_schema.fill_missing(df_pres_mod, 0)
+    df_pres_mod['module_grade'].values[df_pres_mod['module_grade'].values > 100] = 100
+    print(df_pres_mod.head(20))
+
+    ##Calculate correlation for each course abbreviation
+    df_corr_pres_mod = grouped_correlation.grouped_pearson(df_pres_mod, 'presentation_module', 'module_grade', 'number_of_posts')
+    print(df_corr_pres_mod.head(20))
+
+    ##Join to base table
+    df_pres_mod_final = pandas.merge(left=df_pres_mod_base, right=df_corr_pres_mod, how='inner')
+
+    return df_pres_mod_final
+
+@analysis.stage(inputs=['df_pres_mod_final'], memoize=False)
+def presentation_module_export(df_pres_mod_final):
+    print(df_pres_mod_final.head(20))
+
+    ##Export to df_corr_sub_vertical
+    df_pres_mod_final.to_csv('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/df_pres_mod_final.csv')
 
 ################################################################################################################################################################
 ##11.) DATA SOURCE FOR COURSE MODULE
 
-##Base table
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
+@analysis.stage(inputs=['df_module_activity'], outputs=['df_cour_mod_final'])
+def course_module_level(df_module_activity):
+    ##Forum activities
+    forum_activity_mask = module_activity.activity_mask(df_module_activity, module_activity.FORUM_ACTIVITY_FLAGS)
 
-##Sql query
-sql = """
-SELECT CONCAT(SPLIT_PART(A.course_name, '-', 1), '-', SPLIT_PART(A.course_name, '-', 2)) AS course_abbreviation,
-       A.module_nr_from_name,
-       A.module_name,
-       ROUND(AVG(B.module_grade), 2) AS average_grade,
-       SUM(all_posts) AS number_of_posts
-FROM rdw_la.vw_master_alluser_activities A
-LEFT JOIN rdw_la.vw_module_grades B ON B.user_id = A.user_id
-                                    AND B.course_id = A.course_id
-                                    AND B.course_module_id = A.course_module_id
-WHERE A.activity_type IN ('hsuforum', 'forum')
-AND A.user_role = 'student'
-AND (LOWER(A.activity_name) LIKE '%forum%' OR LOWER(A.activity_name) LIKE '%discussion%')
-AND LOWER(A.activity_name) NOT LIKE '%small-group%'
-AND LOWER(A.activity_name) NOT LIKE '%small group%'
-AND LOWER(A.activity_name) NOT LIKE '%graded%'
-AND LOWER(A.activity_name) NOT LIKE '%practical exercise%'
-AND LOWER(A.activity_name) NOT LIKE '%final assignment%'
-AND LOWER(A.activity_name) NOT LIKE '%orientation%'
-AND B.module_grade IS NOT NULL
-GROUP BY CONCAT(SPLIT_PART(A.course_name, '-', 1), '-', SPLIT_PART(A.course_name, '-', 2)),
-         A.module_nr_from_name,
-         A.module_name;
-"""
+    ##Base table
+    df_cour_mod_base = module_activity.module_level(df_module_activity,
+                                                    ['course_abbreviation',
+                                                     'module_nr_from_name',
+                                                     'module_name'],
+                                                    forum_activity_mask)
+    print(df_cour_mod_base.head(20))
 
-##Create pandas dataframe
-df_cour_mod_base = pandas.read_sql_query(sql, rdw_conn)
-print(df_cour_mod_base.head(20))
+    ##Concatenate two strings
+    df_cour_mod_base['course_module'] = df_cour_mod_base['course_abbreviation'].astype(str) + ' ' + df_cour_mod_base['module_name'].astype(str)
+    print(df_cour_mod_base.head(20))
 
-##Concatenate two strings
-df_cour_mod_base['course_module'] = df_cour_mod_base['course_abbreviation'].map(str) + ' ' + df_cour_mod_base['module_name']
-print(df_cour_mod_base.head(20))
+    ##Select specific columns
+    df_cour_mod_base = df_cour_mod_base[['course_module', 'number_of_posts', 'average_grade']]
+    print(df_cour_mod_base.head(20))
 
-##Select specific columns
-df_cour_mod_base = df_cour_mod_base[['course_module', 'number_of_posts', 'average_grade']]
-print(df_cour_mod_base.head(20))
+    ##Correlation creation
+    df_cour_mod = module_activity.student_level(df_module_activity,
+                                                ['course_abbreviation',
+                                                 'module_name',
+                                                 'module_nr_from_name',
+                                                 'student_name',
+                                                 'module_grade'],
+                                                forum_activity_mask)
 
-##Correlation creation
-##Connect to database
-rdw_conn = psycopg2.connect(user=config['USER_LA']['RDW_PROD'],
-                            password=config['PWD_LA']['RDW_PROD'],
-                            host=config['HOST']['RDW_STAG'],
-                            database='rdw')
+    ##Concatenate two strings
+    df_cour_mod['course_module'] = df_cour_mod['course_abbreviation'].astype(str) + ' ' + df_cour_mod['module_name'].astype(str)
 
-##Sql query
-sql = """
-SELECT CONCAT(SPLIT_PART(A.course_name, '-', 1), '-', SPLIT_PART(A.course_name, '-', 2)) AS course_abbreviation,
-       A.module_name,
-       A.module_nr_from_name,
-       CONCAT(A.firstname, ' ', A.lastname) AS student_name,
-       B.module_grade,
-       SUM(all_posts) AS number_of_posts
-FROM rdw_la.vw_master_alluser_activities A
-LEFT JOIN rdw_la.vw_module_grades B ON B.user_id = A.user_id
-                                    AND B.course_id = A.course_id
-                                    AND B.course_module_id = A.course_module_id
-WHERE A.activity_type IN ('hsuforum', 'forum')
-AND A.user_role = 'student'
-AND (LOWER(A.activity_name) LIKE '%forum%' OR LOWER(A.activity_name) LIKE '%discussion%')
-AND LOWER(A.activity_name) NOT LIKE '%small-group%'
-AND LOWER(A.activity_name) NOT LIKE '%small group%'
-AND LOWER(A.activity_name) NOT LIKE '%graded%'
-AND LOWER(A.activity_name) NOT LIKE '%practical exercise%'
-AND LOWER(A.activity_name) NOT LIKE '%final assignment%'
-AND LOWER(A.activity_name) NOT LIKE '%orientation%'
-AND B.module_grade IS NOT NULL
-GROUP BY CONCAT(SPLIT_PART(A.course_name, '-', 1), '-', SPLIT_PART(A.course_name, '-', 2)),
-         A.module_name,
-         A.module_nr_from_name,
-         CONCAT(A.firstname, ' ', A.lastname),
-         B.module_grade;
-"""
-
-##Create pandas dataframe
-df_cour_mod = pandas.read_sql_query(sql, rdw_conn)
+    ##Clean df_extract
+    df_cour_mod = extract_schema.fill_missing(df_cour_mod, 0)
+    df_cour_mod['module_grade'].values[df_cour_mod['module_grade'].values > 100] = 100
+    print(df_cour_mod.head(20))
 
-##Concatenate two strings
-df_cour_mod['course_module'] = df_cour_mod['course_abbreviation'].map(str) + ' ' + df_cour_mod['module_name']
+    ##Calculate correlation for each course abbreviation
+    df_corr_cour_mod = grouped_correlation.grouped_pearson(df_cour_mod, 'course_module', 'module_grade', 'number_of_posts')
+    print(df_corr_cour_mod.head(20))
 
-##Clean df_extract
-df_cour_mod = df_cour_mod.fillna(0)
-df_cour_mod['module_grade'].values[df_cour_mod['module_grade'].values > 100] = 100
-print(df_cour_mod.head(20))
+    ##Join to base table
+    df_cour_mod_final = pandas.merge(left=df_cour_mod_base, right=df_corr_cour_mod, how='inner')
 
-##Calculate correlation for each course abbreviation
-df_corr_cour_mod = pandas.DataFrame(df_cour_mod.groupby('course_module')[['module_grade', 'number_of_posts']].corr().iloc[0::2,-1]).reset_index()
+    return df_cour_mod_final
 
-##Edit resulting dataframe
-df_corr_cour_mod = df_corr_cour_mod[['course_module', 'number_of_posts']]
-df_corr_cour_mod = df_corr_cour_mod.rename(columns={'number_of_posts': 'r_squared'})
-df_corr_cour_mod['r_squared'] = df_corr_cour_mod['r_squared'] ** 2
-df_corr_cour_mod = df_corr_cour_mod.sort_values(by='r_squared', ascending=False)
-print(df_corr_cour_mod.head(20))
+@analysis.stage(inputs=['df_cour_mod_final'], memoize=False)
+def course_module_export(df_cour_mod_final):
+    print(df_cour_mod_final.head(20))
 
-##Join to base table
-df_cour_mod_final = pandas.merge(left=df_cour_mod_base, right=df_corr_cour_mod, how='inner')
-print(df_cour_mod_final.head(20))
+    ##Export to df_corr_sub_vertical
+    df_cour_mod_final.to_csv('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/df_cour_mod_final.csv')
 
-##Export to df_corr_sub_vertical
-df_cour_mod_final.to_csv('/Users/jdeswardt/Documents/projects/discussion_forum_driver_analysis/df_cour_mod_final.csv')
+################################################################################################################################################################
+##12.) RUN
+
+##Run every stage, or only the stages given with --stage and the stages they read from
+##Independent stages run concurrently, memoized stages whose code and inputs are unchanged reuse their stored outputs
+##Extractions always run but are served from the extract cache while the warehouse is unchanged
+##The staging table in rdw_la is only written with --refresh-staging or --full-refresh, or created on first use, never refreshed as a side effect of running a stage
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Discussion forum driver analysis')
+    parser.add_argument('--stage', action='append', choices=sorted(analysis.stages), help='stage to run, can be repeated')
+    parser.add_argument('--workers', type=int, default=pipeline.MAX_WORKERS)
+    parser.add_argument('--refresh-staging', action='store_true', help='rebuild the changed partitions of rdw_la.stg_forum_activity before extracting')
+    parser.add_argument('--full-refresh', action='store_true', help='rebuild all of rdw_la.stg_forum_activity before extracting')
+    parser.add_argument('--no-memo', action='store_true', help='recompute every stage instead of reusing stored outputs')
+    args = parser.parse_args()
+    if args.no_memo:
+        analysis.memo_store = None
+    REFRESH_STAGING = args.refresh_staging
+    FULL_REFRESH = args.full_refresh
+    EXTRACT_COLUMNS = column_projection.required_columns(extract_expressions,
+                                                         extract_columns_by_stage,
+                                                         analysis.upstream(args.stage if args.stage is not None else analysis.stages))
+    analysis.run(args.stage, max_workers=args.workers)
+
+    ##Time of every warehouse query of this run
+    rdw_connection.report_timings()
+
+    ##Write all queued figures concurrently
+    figure_export.render_all()
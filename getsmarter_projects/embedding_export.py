@@ -0,0 +1,151 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# EMBEDDING EXPORT
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import json
+import pathlib
+import timeit
+import numpy
+import course_similarity
+
+##Export settings
+EXPORT_DIR = pathlib.Path.home() / 'course2vec' / 'export'
+QUANTIZATIONS = ['float32', 'float16', 'int8', 'pq']
+PQ_SUBSPACES = 10
+PQ_CENTROIDS = 256
+KMEANS_ITERATIONS = 20
+CHUNK_SIZE = 65536
+
+################################################################################################################################################################
+#2.) QUANTIZATION
+
+##Euclidean k-means returning the centroids and the code of every vector
+def _kmeans(vectors, k, iterations=KMEANS_ITERATIONS, random_state=23):
+    k = min(k, len(vectors))
+    rng = numpy.random.default_rng(random_state)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+        codes = numpy.argmin(distances, axis=1)
+        counts = numpy.bincount(codes, minlength=k)
+        for dimension in range(vectors.shape[1]):
+            sums = numpy.bincount(codes, weights=vectors[:, dimension], minlength=k)
+            centroids[counts > 0, dimension] = sums[counts > 0] / counts[counts > 0]
+    return centroids, codes
+
+##Arrays stored for each quantization of unit length vectors
+def quantize(vectors, quantization, pq_subspaces=PQ_SUBSPACES, pq_centroids=PQ_CENTROIDS):
+    if quantization == 'float32':
+        return {'vectors': vectors.astype(numpy.float32)}
+    if quantization == 'float16':
+        return {'vectors': vectors.astype(numpy.float16)}
+    if quantization == 'int8':
+        ##Symmetric scalar quantization with one scale per dimension
+        scales = numpy.maximum(numpy.abs(vectors).max(axis=0), numpy.finfo(numpy.float32).tiny) / 127
+        return {'codes': numpy.round(vectors / scales).astype(numpy.int8), 'scales': scales.astype(numpy.float32)}
+    if quantization == 'pq':
+        ##Product quantization: each subspace of the vector is replaced by the id of its nearest of pq_centroids centroids
+        subspaces = numpy.array_split(numpy.arange(vectors.shape[1]), pq_subspaces)
+        codebooks = numpy.zeros((pq_subspaces, pq_centroids, max(len(dimensions) for dimensions in subspaces)), dtype=numpy.float32)
+        codes = numpy.zeros((len(vectors), pq_subspaces), dtype=numpy.uint8)
+        for subspace, dimensions in enumerate(subspaces):
+            centroids, codes[:, subspace] = _kmeans(vectors[:, dimensions], pq_centroids)
+            codebooks[subspace, :len(centroids), :len(dimensions)] = centroids
+        return {'codes': codes, 'codebooks': codebooks, 'subspace_sizes': numpy.array([len(dimensions) for dimensions in subspaces])}
+    raise ValueError('Unknown quantization: {}'.format(quantization))
+
+################################################################################################################################################################
+#3.) EXPORT AND LOAD
+
+##Write unit length vectors of a gensim KeyedVectors as memory-mappable .npy arrays with a vocabulary index
+##The manifest lists the arrays of this export, so arrays left by an earlier export with another quantization are ignored
+def export(wv, directory=EXPORT_DIR, quantization='float32', **params):
+    words, vectors = course_similarity.normalised_vectors(wv)
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    arrays = quantize(vectors, quantization, **params)
+    for name, array in arrays.items():
+        numpy.save(directory / (name + '.npy'), array)
+    with open(directory / 'manifest.json', 'w') as file:
+        json.dump({'quantization': quantization,
+                   'dimensions': vectors.shape[1],
+                   'arrays': sorted(arrays),
+                   'words': [str(word) for word in words]}, file)
+    return directory
+
+##Exported embeddings loaded memory-mapped, scored without expanding the whole matrix
+class EmbeddingStore:
+
+    def __init__(self, directory, mmap_mode='r'):
+        directory = pathlib.Path(directory)
+        with open(directory / 'manifest.json') as file:
+            manifest = json.load(file)
+        self.quantization = manifest['quantization']
+        self.words = numpy.asarray(manifest['words'], dtype=object)
+        self.positions = {word: position for position, word in enumerate(self.words)}
+        self.arrays = {name: numpy.load(directory / (name + '.npy'), mmap_mode=mmap_mode) for name in manifest['arrays']}
+
+    ##Float32 vectors for the given rows
+    def vectors(self, rows):
+        if self.quantization in ('float32', 'float16'):
+            return numpy.asarray(self.arrays['vectors'][rows], dtype=numpy.float32)
+        if self.quantization == 'int8':
+            return self.arrays['codes'][rows].astype(numpy.float32) * self.arrays['scales']
+        codes = self.arrays['codes'][rows]
+        parts = [self.arrays['codebooks'][subspace, codes[:, subspace], :size]
+                 for subspace, size in enumerate(self.arrays['subspace_sizes'])]
+        return numpy.concatenate(parts, axis=1)
+
+    ##Inner products of one query vector with every stored vector, chunk by chunk
+    def scores(self, query):
+        if self.quantization == 'pq':
+            ##Asymmetric distance: look up the query's product with every centroid instead of decoding the vectors
+            starts = numpy.concatenate([[0], numpy.cumsum(self.arrays['subspace_sizes'])])
+            tables = numpy.stack([self.arrays['codebooks'][subspace, :, :size] @ query[starts[subspace]:starts[subspace + 1]]
+                                  for subspace, size in enumerate(self.arrays['subspace_sizes'])])
+            codes = self.arrays['codes']
+            return tables[numpy.arange(tables.shape[0]), codes].sum(axis=1)
+        return numpy.concatenate([self.vectors(slice(start, start + CHUNK_SIZE)) @ query
+                                  for start in range(0, len(self.words), CHUNK_SIZE)])
+
+    def most_similar(self, word, topn=10):
+        position = self.positions[word]
+        scores = self.scores(self.vectors([position])[0])
+        scores[position] = -numpy.inf
+        ids, best = course_similarity.top_k(scores[None, :], topn)
+        return [(self.words[i], float(score)) for i, score in zip(ids[0], best[0])]
+
+def load(directory=EXPORT_DIR):
+    return EmbeddingStore(directory)
+
+################################################################################################################################################################
+#4.) BENCHMARK
+
+##Size, load time and recall@topn of most_similar for every quantization against the float32 model vectors
+def benchmark(wv, directory=EXPORT_DIR, topn=10, number_of_queries=200, random_state=23, **params):
+    words, vectors = course_similarity.normalised_vectors(wv)
+    rng = numpy.random.default_rng(random_state)
+    rows = rng.choice(len(words), min(number_of_queries, len(words)), replace=False)
+    exact = vectors[rows] @ vectors.T
+    exact[numpy.arange(len(rows)), rows] = -numpy.inf
+    expected, _ = course_similarity.top_k(exact, topn)
+    results = []
+    for quantization in QUANTIZATIONS:
+        path = export(wv, pathlib.Path(directory) / quantization, quantization, **(params if quantization == 'pq' else {}))
+        start = timeit.default_timer()
+        store = load(path)
+        load_seconds = timeit.default_timer() - start
+        found = 0
+        for row, truth in zip(rows, expected):
+            neighbours = [store.positions[word] for word, _ in store.most_similar(words[row], topn)]
+            found += len(numpy.intersect1d(neighbours, truth))
+        results.append({'quantization': quantization,
+                        'megabytes': sum((path / (name + '.npy')).stat().st_size for name in store.arrays) / 1024 ** 2,
+                        'load_seconds': load_seconds,
+                        'recall': found / (len(rows) * expected.shape[1])})
+    return results
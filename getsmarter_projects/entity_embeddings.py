@@ -0,0 +1,106 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# ENTITY EMBEDDINGS
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import hashlib
+import pathlib
+import timeit
+import numpy
+import pandas
+import gensim.models
+import course_sentences
+import course2vec_training
+
+##Token prefix of every entity type, so a course, presentation and module with the same code stay separate words
+TOKEN_PREFIXES = {'course_code': 'C', 'presentation_code': 'P', 'module_code': 'M'}
+
+##Default model settings, a wider window so a course's presentation and module tokens share context
+MODEL_PARAMS = dict(course2vec_training.MODEL_PARAMS, window=5, negative=5, sample=1e-3, ns_exponent=0.75)
+
+################################################################################################################################################################
+#2.) CORPUS
+
+##One row per person and typed token, with the course code the token belongs to for ordering within the sentence
+def entity_tokens(df, person_column='person_code', course_column='course_code'):
+    frames = []
+    for column, prefix in TOKEN_PREFIXES.items():
+        present = df[column].notna()
+        frames.append(pandas.DataFrame({person_column: df.loc[present, person_column].to_numpy(),
+                                        'course_order': df.loc[present, course_column].to_numpy(),
+                                        'token': (prefix + ':' + df.loc[present, column].astype(str)).to_numpy()}))
+    return pandas.concat(frames, ignore_index=True).drop_duplicates()
+
+##Remove tokens seen fewer than min_count times and renumber the rest by descending count
+##Works on the int32 token array only, so the cost does not depend on the size of the vocabulary strings
+def prune(corpus, min_count=MODEL_PARAMS['min_count']):
+    tokens = numpy.asarray(corpus.tokens[corpus.offsets[0]:corpus.offsets[-1]])
+    counts = numpy.bincount(tokens, minlength=len(corpus.vocabulary))
+    ranked = numpy.argsort(-counts, kind='stable')[:int((counts >= min_count).sum())]
+    remap = numpy.full(len(corpus.vocabulary), -1, dtype=numpy.int32)
+    remap[ranked] = numpy.arange(len(ranked), dtype=numpy.int32)
+    tokens = remap[tokens]
+    kept = tokens >= 0
+    sentence_ids = numpy.repeat(numpy.arange(len(corpus)), numpy.diff(corpus.offsets))
+    sentence_lengths = numpy.bincount(sentence_ids[kept], minlength=len(corpus))
+    people = corpus.people[sentence_lengths > 0] if corpus.people is not None else None
+    sentence_lengths = sentence_lengths[sentence_lengths > 0]
+    offsets = numpy.concatenate([[0], numpy.cumsum(sentence_lengths)]).astype(numpy.int64)
+    return course_sentences.CourseCorpus(tokens[kept], offsets, corpus.vocabulary[ranked], people)
+
+################################################################################################################################################################
+#3.) TRAINING
+
+##Version of a corpus: a hash of its token, offset and vocabulary arrays
+def corpus_version(corpus):
+    digest = hashlib.sha256(numpy.ascontiguousarray(corpus.tokens[corpus.offsets[0]:corpus.offsets[-1]]).tobytes())
+    digest.update(numpy.diff(corpus.offsets).tobytes())
+    digest.update('\n'.join(corpus.vocabulary).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+##Word2vec model with its vocabulary built from the word counts of the pruned corpus rather than a scan of the sentences
+##gensim derives the subsampling thresholds and the negative sampling table from those counts
+def build_model(corpus, **params):
+    model = gensim.models.Word2Vec(**dict(MODEL_PARAMS, **params))
+    model.build_vocab_from_freq({str(word): int(count) for word, count in zip(corpus.vocabulary, corpus.counts())},
+                                corpus_count=len(corpus))
+    return model
+
+##Untrained model with the vocabulary and sampling tables of a corpus version, built once and loaded by later runs
+##The saved model is replaced when the corpus or the model settings change
+def vocabulary_model(corpus, model_dir, version, **params):
+    path = pathlib.Path(model_dir) / 'entity2vec_vocabulary.model'
+    version_path = pathlib.Path(model_dir) / 'entity2vec_vocabulary.txt'
+    version = '{}/{}'.format(version, hashlib.sha256(repr(sorted(params.items())).encode('utf-8')).hexdigest()[:16])
+    if path.exists() and version_path.exists() and version_path.read_text() == version:
+        print('Loaded entity vocabulary')
+        return gensim.models.Word2Vec.load(str(path))
+    model = build_model(corpus, **params)
+    pathlib.Path(model_dir).mkdir(parents=True, exist_ok=True)
+    model.save(str(path))
+    version_path.write_text(version)
+    return model
+
+##Prune the corpus, save it when it changed, then train on the compact corpus streamed sentence by sentence
+def train(corpus, corpus_dir, model_dir, **params):
+    params = dict(MODEL_PARAMS, **params)
+    start = timeit.default_timer()
+    corpus_dir = pathlib.Path(corpus_dir)
+    corpus = prune(corpus, params['min_count'])
+    version = corpus_version(corpus)
+    version_path = corpus_dir / 'version.txt'
+    if not version_path.exists() or version_path.read_text() != version:
+        corpus.save(corpus_dir)
+        version_path.write_text(version)
+    model = vocabulary_model(corpus, model_dir, version, **params)
+    model.train(corpus,
+                total_examples=len(corpus),
+                total_words=corpus.number_of_words(),
+                epochs=model.epochs)
+    print('Entity vocabulary: {} tokens, time: {}'.format(len(model.wv.vocab), timeit.default_timer() - start))
+    model.save(str(pathlib.Path(model_dir) / 'entity2vec.model'))
+    return model
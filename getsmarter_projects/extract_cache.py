@@ -0,0 +1,122 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# EXTRACT CACHE
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+import pyarrow
+import pyarrow.parquet
+import extract_schema
+import rdw_connection
+
+##Cache settings
+CACHE_DIR = pathlib.Path.home() / '.rdw_extract_cache'
+MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+MAX_CACHE_BYTES = 5 * 1024 ** 3
+COMPRESSION = 'zstd'
+
+##Set RDW_CACHE_REFRESH=1 to ignore cached extracts and pull everything again
+FORCE_REFRESH = os.environ.get('RDW_CACHE_REFRESH', '0') == '1'
+
+################################################################################################################################################################
+#2.) CACHE KEYS
+
+##Hash the sql text, parameters, declared schema and source version into a cache key
+##source_version identifies the state of the data the query reads, e.g. the staging watermark returned by forum_staging.refresh()
+##Sources without a load timestamp fall back to the snapshot date, so their extracts are pulled again once a day
+def cache_key(sql, params=None, source_version=None, schema=None):
+    if source_version is None:
+        source_version = datetime.date.today()
+    payload = json.dumps({'sql': ' '.join(sql.split()),
+                          'params': params,
+                          'schema': schema,
+                          'source_version': str(source_version)}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+##Source version of a query that reads a versioned table and also unversioned sources, e.g. staging joined to rdw_bcd
+##The snapshot date is added so changes in the unversioned sources are pulled again once a day
+def snapshot_version(source_version):
+    return '{}/{}'.format(source_version, datetime.date.today())
+
+##Location of the cached file for a key
+def cache_path(key):
+    return CACHE_DIR / (key + '.parquet')
+
+################################################################################################################################################################
+#3.) EVICTION
+
+##Extractions run concurrently on the pipeline's threads, evictions are serialised and files may vanish between listing and reading
+_evict_lock = threading.Lock()
+
+##Remove files older than the maximum age, then the least recently used files until under the size budget
+def evict(max_age=MAX_AGE_SECONDS, max_bytes=MAX_CACHE_BYTES):
+    if not CACHE_DIR.exists():
+        return
+    with _evict_lock:
+        now = time.time()
+        files = []
+        for path in CACHE_DIR.glob('*.parquet'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > max_age:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((stat.st_atime, stat.st_size, path))
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_bytes <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+
+################################################################################################################################################################
+#4.) CACHED EXTRACTION
+
+##Read a cached extract memory-mapped, or None when it is missing or expired
+def load(key, max_age=MAX_AGE_SECONDS):
+    path = cache_path(key)
+    try:
+        mtime = path.stat().st_mtime
+        if time.time() - mtime > max_age:
+            return None
+        table = pyarrow.parquet.read_table(path, memory_map=True)
+        os.utime(path, (time.time(), mtime))
+    except FileNotFoundError:
+        return None
+    return table.to_pandas()
+
+##Write an extract to the cache as compressed parquet, keeping the pandas dtypes
+def store(key, df):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = cache_path(key)
+    temp_path = path.with_suffix('.{}.tmp'.format(uuid.uuid4().hex))
+    pyarrow.parquet.write_table(pyarrow.Table.from_pandas(df, preserve_index=False), temp_path, compression=COMPRESSION)
+    os.replace(temp_path, path)
+    evict()
+
+##Return the extract for a query from the cache, querying the warehouse only on a miss
+##schema declares column types (see extract_schema), applied while streaming and to extracts loaded from the cache
+def read_sql(sql, params=None, name='query', source_version=None, refresh=False, schema=None):
+    key = cache_key(sql, params, source_version, schema)
+    if not (refresh or FORCE_REFRESH):
+        df = load(key)
+        if df is not None:
+            print('Loaded {} from cache'.format(name))
+            return extract_schema.apply_schema(df, schema)
+    df = rdw_connection.read_sql_streaming(sql, params=params, name=name, dtypes=extract_schema.buffer_dtypes(schema))
+    df = extract_schema.apply_schema(df, schema)
+    store(key, df)
+    return df
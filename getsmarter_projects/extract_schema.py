@@ -0,0 +1,62 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# EXTRACT SCHEMA
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import numpy
+import pandas
+
+################################################################################################################################################################
+#2.) TYPES
+
+##Numpy dtype a streamed column is preallocated with, so declared numeric columns are never held as 64 bit or objects
+##Integer buffers with NULLs come out as nullable integers of the same width and are cast to the declared type afterwards
+def buffer_dtypes(schema):
+    dtypes = {}
+    for column, dtype in (schema or {}).items():
+        if dtype in ('int64', 'Int64'):
+            dtypes[column] = numpy.int64
+        elif dtype in ('int32', 'Int32'):
+            dtypes[column] = numpy.int32
+        elif dtype == 'float32':
+            dtypes[column] = numpy.float32
+    return dtypes
+
+##A schema maps column names to pandas dtypes: 'category' for repeated strings and codes,
+##'int64' for ids, which can pass 2**31, 'int32'/'float32' for counts and measures,
+##and the nullable 'Int64'/'Int32' for integers that can be missing
+##Cast the columns of a dataframe to their declared types, leaving columns that already match or are not declared untouched
+##Integer columns with missing values become the nullable type of the same width
+def apply_schema(df, schema):
+    if not schema:
+        return df
+    types = {}
+    for column, dtype in schema.items():
+        if column not in df.columns or str(df[column].dtype).lower() == dtype.lower():
+            continue
+        if dtype in ('int32', 'int64') and df[column].isna().any():
+            dtype = dtype.capitalize()
+        types[column] = dtype
+    return df.astype(types) if types else df
+
+################################################################################################################################################################
+#3.) CLEANING
+
+##fillna for typed frames: only numeric columns are filled, label columns (categoricals, strings) stay missing
+##A filled label would show up as its own "0" group in the grouped correlations and scatter reports
+def fill_missing(df, value=0):
+    df = df.copy()
+    for column in df.columns:
+        if pandas.api.types.is_numeric_dtype(df[column].dtype) and df[column].isna().any():
+            df[column] = df[column].fillna(value)
+    return df
+
+##Prefix codes, e.g. course_code 1.0 becomes A1.0; categorical columns only relabel their categories
+def prefix_codes(series, prefix):
+    if isinstance(series.dtype, pandas.CategoricalDtype):
+        return series.cat.rename_categories([prefix + str(category) for category in series.cat.categories])
+    return prefix + series.astype(str)
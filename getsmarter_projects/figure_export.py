@@ -0,0 +1,70 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# FIGURE EXPORT
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import concurrent.futures
+import multiprocessing
+import os
+import timeit
+import plotly.graph_objects
+import plotly.io
+
+##Export settings
+MAX_WORKERS = os.cpu_count()
+CHUNK_SIZE = 4
+
+################################################################################################################################################################
+#2.) WORKERS
+
+##Start the static image renderer once per worker process so every export in that worker reuses it
+def _start_renderer():
+    plotly.graph_objects.Figure().to_image(format='png', width=10, height=10)
+
+##Render one figure spec to its file
+def _write_image(spec):
+    figure_json, path, kwargs = spec
+    plotly.io.from_json(figure_json).write_image(path, **kwargs)
+    return path
+
+################################################################################################################################################################
+#3.) EXPORT QUEUE
+
+##Collects figures and writes them all as static images across a process pool
+class FigureExportQueue:
+
+    def __init__(self):
+        self.specs = []
+
+    def add(self, fig, path, **kwargs):
+        self.specs.append((fig.to_json(), path, kwargs))
+
+    def render(self, max_workers=MAX_WORKERS):
+        if not self.specs:
+            return []
+        start = timeit.default_timer()
+        ##Spawn rather than fork, the calling script has database and pipeline threads running by now
+        ##Workers only receive figure json, and the analysis scripts only run their stages under __main__
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(max_workers, len(self.specs)),
+                                                    mp_context=context,
+                                                    initializer=_start_renderer) as executor:
+            paths = list(executor.map(_write_image, self.specs, chunksize=CHUNK_SIZE))
+        self.specs = []
+        print('Exported {} figures in {:.2f}s'.format(len(paths), timeit.default_timer() - start))
+        return paths
+
+##Shared queue used by the analysis scripts
+export_queue = FigureExportQueue()
+
+##Queue a figure to be written to a static image by render_all
+def write_image(fig, path, **kwargs):
+    export_queue.add(fig, path, **kwargs)
+
+##Write every queued figure
+def render_all(max_workers=MAX_WORKERS):
+    return export_queue.render(max_workers)
@@ -0,0 +1,178 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# FORUM ACTIVITY STAGING TABLE
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import rdw_connection
+
+##Staging table settings
+STAGING_TABLE = 'rdw_la.stg_forum_activity'
+SOURCE_VIEW = 'rdw_la.vw_master_alluser_activities'
+
+##Column of the source view used as the incremental refresh watermark
+WATERMARK_COLUMN = 'updated_at'
+
+##Columns of the partitions an incremental refresh rebuilds, the source has no per-row key to upsert on
+PARTITION_COLUMNS = ['university', 'course_id']
+
+################################################################################################################################################################
+#2.) SQL
+
+##Staging table with the activity classification precomputed from the activity and module names
+create_sql = """
+CREATE TABLE IF NOT EXISTS {table} (
+    university VARCHAR(256),
+    course_name VARCHAR(256),
+    course_id BIGINT,
+    course_module_id BIGINT,
+    module_nr_from_name VARCHAR(64),
+    module_name VARCHAR(1024),
+    activity_type VARCHAR(64),
+    activity_name VARCHAR(1024),
+    user_id BIGINT,
+    user_role VARCHAR(64),
+    firstname VARCHAR(256),
+    lastname VARCHAR(256),
+    all_posts BIGINT,
+    nr_of_likes BIGINT,
+    is_class_wide BOOLEAN,
+    is_class_wide_hyphenated BOOLEAN,
+    is_discussion_forum BOOLEAN,
+    is_forum BOOLEAN,
+    is_excluded BOOLEAN,
+    is_orientation_activity BOOLEAN,
+    is_orientation_module BOOLEAN,
+    activity_class VARCHAR(32),
+    {watermark} TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS stg_forum_activity_key_idx ON {table} (university, course_id, user_id, course_module_id);
+"""
+
+##Source rows, classified once on the way in
+##Only forum activities and class-wide activities are kept
+##is_class_wide also matches 'class wide' as the correlation extract always did, the driver and module sections only ever
+##matched 'class-wide' and read is_class_wide_hyphenated so their results are unchanged
+select_rows_sql = """
+SELECT university,
+       course_name,
+       course_id,
+       course_module_id,
+       module_nr_from_name,
+       module_name,
+       activity_type,
+       activity_name,
+       user_id,
+       user_role,
+       firstname,
+       lastname,
+       all_posts,
+       nr_of_likes,
+       (LOWER(activity_name) LIKE '%class-wide%' OR LOWER(activity_name) LIKE '%class wide%') AS is_class_wide,
+       LOWER(activity_name) LIKE '%class-wide%' AS is_class_wide_hyphenated,
+       LOWER(activity_name) LIKE '%discussion forum%' AS is_discussion_forum,
+       (LOWER(activity_name) LIKE '%forum%' OR LOWER(activity_name) LIKE '%discussion%') AS is_forum,
+       (LOWER(activity_name) LIKE '%small-group%'
+        OR LOWER(activity_name) LIKE '%small group%'
+        OR LOWER(activity_name) LIKE '%graded%'
+        OR LOWER(activity_name) LIKE '%practical exercise%'
+        OR LOWER(activity_name) LIKE '%final assignment%') AS is_excluded,
+       LOWER(activity_name) LIKE '%orientation%' AS is_orientation_activity,
+       LOWER(module_name) LIKE '%orientation%' AS is_orientation_module,
+       CASE WHEN LOWER(activity_name) LIKE '%orientation%' OR LOWER(module_name) LIKE '%orientation%' THEN 'orientation'
+            WHEN LOWER(activity_name) LIKE '%small-group%' OR LOWER(activity_name) LIKE '%small group%' THEN 'small_group'
+            WHEN LOWER(activity_name) LIKE '%graded%' THEN 'graded'
+            WHEN LOWER(activity_name) LIKE '%practical exercise%' THEN 'practical_exercise'
+            WHEN LOWER(activity_name) LIKE '%final assignment%' THEN 'final_assignment'
+            WHEN LOWER(activity_name) LIKE '%class-wide%' OR LOWER(activity_name) LIKE '%class wide%' THEN 'class_wide'
+            WHEN LOWER(activity_name) LIKE '%discussion forum%' THEN 'discussion_forum'
+            WHEN LOWER(activity_name) LIKE '%forum%' OR LOWER(activity_name) LIKE '%discussion%' THEN 'forum'
+            ELSE 'other' END AS activity_class,
+       {watermark}
+FROM {source}
+WHERE (activity_type IN ('hsuforum', 'forum')
+       OR LOWER(activity_name) LIKE '%class-wide%'
+       OR LOWER(activity_name) LIKE '%class wide%')
+{condition}
+"""
+
+##Rebuild the whole table from the source, in one transaction so readers see the old or the new table
+rebuild_sql = """
+DROP TABLE IF EXISTS {table};
+{create}
+INSERT INTO {table}
+{select_rows};
+ANALYZE {table};
+"""
+
+##Rebuild only the partitions with source rows newer than the watermark
+##Every row of a changed partition is replaced, so duplicate activity rows and rows deleted in those partitions stay in step
+##Rows deleted from a partition with no newer rows are not seen, a full rebuild picks those up
+refresh_sql = """
+CREATE TEMP TABLE stg_forum_activity_changed ON COMMIT DROP AS
+SELECT DISTINCT {partition_columns}
+FROM {source}
+WHERE {watermark} > COALESCE((SELECT MAX({watermark}) FROM {table}), '1900-01-01'::TIMESTAMP);
+DELETE FROM {table} S
+USING stg_forum_activity_changed N
+WHERE {partition_match};
+INSERT INTO {table}
+{select_rows};
+ANALYZE {table};
+"""
+
+##Latest watermark and row count of the staging table, together they identify its contents
+version_sql = """
+SELECT MAX({watermark}) AS watermark,
+       COUNT(*) AS number_of_rows
+FROM {table};
+"""
+
+##Whether the staging table exists yet
+exists_sql = """
+SELECT TO_REGCLASS('{table}') IS NOT NULL AS table_exists;
+"""
+
+################################################################################################################################################################
+#3.) REFRESH
+
+##Create the staging table and its index if they do not exist yet
+def create():
+    rdw_connection.execute(create_sql.format(table=STAGING_TABLE, watermark=WATERMARK_COLUMN), name='create ' + STAGING_TABLE)
+
+##Whether the staging table has been created in the warehouse
+def exists():
+    df = rdw_connection.read_sql(exists_sql.format(table=STAGING_TABLE), name='exists ' + STAGING_TABLE)
+    return bool(df['table_exists'].iloc[0])
+
+##Version of the staging table contents, used to key cached extracts that read from it
+def version():
+    df = rdw_connection.read_sql(version_sql.format(table=STAGING_TABLE, watermark=WATERMARK_COLUMN), name='version ' + STAGING_TABLE)
+    return '{}/{}'.format(df['watermark'].iloc[0], df['number_of_rows'].iloc[0])
+
+##Bring the staging table up to date and return its version
+##By default only the partitions with rows newer than the last watermark are rebuilt, full=True rebuilds the whole table
+def refresh(full=False):
+    if full:
+        select_rows = select_rows_sql.format(source=SOURCE_VIEW, watermark=WATERMARK_COLUMN, condition='')
+        rdw_connection.execute(rebuild_sql.format(table=STAGING_TABLE,
+                                                  create=create_sql.format(table=STAGING_TABLE, watermark=WATERMARK_COLUMN).strip(),
+                                                  select_rows=select_rows.strip()),
+                               name='rebuild ' + STAGING_TABLE)
+        return version()
+    create()
+    partition_match = '\n  AND '.join('S.{0} IS NOT DISTINCT FROM N.{0}'.format(column) for column in PARTITION_COLUMNS)
+    changed = ' AND '.join('N.{0} IS NOT DISTINCT FROM {1}.{0}'.format(column, SOURCE_VIEW) for column in PARTITION_COLUMNS)
+    condition = 'AND EXISTS (SELECT 1 FROM stg_forum_activity_changed N WHERE {})'.format(changed)
+    select_rows = select_rows_sql.format(source=SOURCE_VIEW, watermark=WATERMARK_COLUMN, condition=condition)
+    rdw_connection.execute(refresh_sql.format(table=STAGING_TABLE,
+                                              source=SOURCE_VIEW,
+                                              watermark=WATERMARK_COLUMN,
+                                              partition_columns=', '.join(PARTITION_COLUMNS),
+                                              partition_match=partition_match,
+                                              select_rows=select_rows.strip()),
+                           name='refresh ' + STAGING_TABLE)
+    return version()
@@ -0,0 +1,115 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# GROUPED CORRELATION
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import numpy
+import pandas
+import scipy.special
+
+################################################################################################################################################################
+#2.) SUFFICIENT STATISTICS
+
+##Sums needed for a Pearson correlation, accumulated per group id with bincount
+##Rows where x or y is missing are dropped, matching pandas corr
+def pearson_sums(group_ids, x, y, number_of_groups):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    valid = (group_ids >= 0) & ~numpy.isnan(x) & ~numpy.isnan(y)
+    group_ids, x, y = group_ids[valid], x[valid], y[valid]
+    ##Correlation is unchanged by a shift, so centre on the overall means to limit rounding error
+    if len(x):
+        x = x - x.mean()
+        y = y - y.mean()
+    return {'n': numpy.bincount(group_ids, minlength=number_of_groups).astype(numpy.float64),
+            'sum_x': numpy.bincount(group_ids, weights=x, minlength=number_of_groups),
+            'sum_y': numpy.bincount(group_ids, weights=y, minlength=number_of_groups),
+            'sum_xy': numpy.bincount(group_ids, weights=x * y, minlength=number_of_groups),
+            'sum_xx': numpy.bincount(group_ids, weights=x * x, minlength=number_of_groups),
+            'sum_yy': numpy.bincount(group_ids, weights=y * y, minlength=number_of_groups)}
+
+##Pearson r and two sided p-value from the sufficient statistics
+##Groups with fewer than two rows or no variance get NaN, as pandas corr does
+def pearson_from_sums(n, sum_x, sum_y, sum_xy, sum_xx, sum_yy):
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        covariance = n * sum_xy - sum_x * sum_y
+        variance_x = n * sum_xx - sum_x ** 2
+        variance_y = n * sum_yy - sum_y ** 2
+        r = covariance / numpy.sqrt(variance_x * variance_y)
+        constant = (variance_x <= 1e-12 * n * sum_xx) | (variance_y <= 1e-12 * n * sum_yy)
+        r = numpy.where((n < 2) | constant, numpy.nan, numpy.clip(r, -1, 1))
+        ##Student t test of r with n - 2 degrees of freedom, written with the regularised incomplete beta function
+        degrees_of_freedom = numpy.where(n > 2, n - 2, numpy.nan)
+        p_value = scipy.special.betainc(degrees_of_freedom / 2, 0.5, 1 - r ** 2)
+    return r, p_value
+
+################################################################################################################################################################
+#3.) GROUPED CORRELATION
+
+##Correlation between x and y for every group of key in a single pass
+##Returns one row per group with r, r_squared, n and p_value, sorted by r_squared
+def grouped_pearson(df, key, x, y):
+    group_ids, groups = pandas.factorize(df[key], sort=True)
+    sums = pearson_sums(group_ids, df[x].to_numpy(), df[y].to_numpy(), len(groups))
+    r, p_value = pearson_from_sums(**sums)
+    df_corr = pandas.DataFrame({key: groups,
+                                'r': r,
+                                'r_squared': r ** 2,
+                                'n': sums['n'].astype(numpy.int64),
+                                'p_value': p_value})
+    return df_corr.sort_values(by='r_squared', ascending=False)
+
+################################################################################################################################################################
+#4.) THRESHOLD SWEEP
+
+##Correlation between x and y for the rows where threshold_column is greater than every cutoff from 0 to its maximum
+##Rows are sorted once and each cutoff is read from suffix sums, so no filtered copies are made
+##by gives one curve per group, e.g. customer_tribe or course_abbreviation
+def threshold_sweep(df, threshold_column, x, y, by=None):
+    threshold = df[threshold_column].to_numpy(dtype=numpy.float64)
+    x_values = df[x].to_numpy(dtype=numpy.float64)
+    y_values = df[y].to_numpy(dtype=numpy.float64)
+    if by is None:
+        group_ids, groups = numpy.zeros(len(df), dtype=numpy.int64), None
+    else:
+        group_ids, groups = pandas.factorize(df[by], sort=True)
+    valid = (group_ids >= 0) & ~numpy.isnan(threshold) & ~numpy.isnan(x_values) & ~numpy.isnan(y_values)
+    group_ids, threshold, x_values, y_values = group_ids[valid], threshold[valid], x_values[valid], y_values[valid]
+    number_of_groups = 1 if groups is None else len(groups)
+    cutoffs = numpy.arange(0, int(numpy.ceil(threshold.max())) + 1 if len(threshold) else 1)
+
+    ##Sort by group then threshold and take prefix sums of the sufficient statistics
+    order = numpy.lexsort((threshold, group_ids))
+    group_ids, threshold = group_ids[order], threshold[order]
+    x_values = x_values[order] - (x_values.mean() if len(x_values) else 0)
+    y_values = y_values[order] - (y_values.mean() if len(y_values) else 0)
+    prefix = {name: numpy.concatenate([[0], numpy.cumsum(values)])
+              for name, values in [('n', numpy.ones(len(x_values))),
+                                   ('sum_x', x_values),
+                                   ('sum_y', y_values),
+                                   ('sum_xy', x_values * y_values),
+                                   ('sum_xx', x_values * x_values),
+                                   ('sum_yy', y_values * y_values)]}
+
+    ##For every group and cutoff the qualifying rows run from the first threshold above the cutoff to the group end
+    offset = cutoffs[-1] + 1
+    sort_key = group_ids * offset + threshold
+    grid_groups = numpy.repeat(numpy.arange(number_of_groups), len(cutoffs))
+    grid_cutoffs = numpy.tile(cutoffs, number_of_groups)
+    starts = numpy.searchsorted(sort_key, grid_groups * offset + grid_cutoffs, side='right')
+    ends = numpy.searchsorted(group_ids, grid_groups, side='right')
+    sums = {name: values[ends] - values[starts] for name, values in prefix.items()}
+    r, p_value = pearson_from_sums(**sums)
+
+    df_sweep = pandas.DataFrame({'cutoff': grid_cutoffs,
+                                 'n': sums['n'].astype(numpy.int64),
+                                 'r': r,
+                                 'r_squared': r ** 2,
+                                 'p_value': p_value})
+    if by is not None:
+        df_sweep.insert(0, by, numpy.asarray(groups)[grid_groups])
+    return df_sweep
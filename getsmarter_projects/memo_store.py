@@ -0,0 +1,109 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# MEMO STORE
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import json
+import os
+import pathlib
+import pickle
+import shutil
+import threading
+import time
+import uuid
+import pandas
+import pyarrow
+import pyarrow.parquet
+
+##Store settings
+MEMO_DIR = pathlib.Path.home() / '.rdw_memo_store'
+MAX_MEMO_BYTES = 2 * 1024 ** 3
+COMPRESSION = 'zstd'
+
+################################################################################################################################################################
+#2.) VALUES
+
+##Write one value: dataframes as compressed parquet, anything parquet cannot hold (e.g. mixed type columns) pickled
+def _write_value(directory, name, value):
+    if isinstance(value, pandas.DataFrame):
+        try:
+            pyarrow.parquet.write_table(pyarrow.Table.from_pandas(value), directory / (name + '.parquet'), compression=COMPRESSION)
+            return 'parquet'
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError, ValueError):
+            pass
+    with open(directory / (name + '.pickle'), 'wb') as file:
+        pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return 'pickle'
+
+def _read_value(directory, name, value_format):
+    if value_format == 'parquet':
+        return pyarrow.parquet.read_table(directory / (name + '.parquet'), memory_map=True).to_pandas()
+    with open(directory / (name + '.pickle'), 'rb') as file:
+        return pickle.load(file)
+
+################################################################################################################################################################
+#3.) STORE
+
+##Stage outputs on disk, addressed by the key of the stage run that produced them (code version plus input fingerprints)
+##An entry is a directory of one file per output and a manifest, evicted least recently used first above the size budget
+class MemoStore:
+
+    def __init__(self, directory=MEMO_DIR, max_bytes=MAX_MEMO_BYTES):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def entry_path(self, key):
+        return self.directory / key
+
+    ##Outputs stored under a key, or None when there are none
+    def load(self, key):
+        manifest_path = self.entry_path(key) / 'manifest.json'
+        try:
+            with open(manifest_path) as file:
+                manifest = json.load(file)
+            outputs = {name: _read_value(self.entry_path(key), name, value_format) for name, value_format in manifest['outputs'].items()}
+        except FileNotFoundError:
+            return None
+        os.utime(manifest_path, (time.time(), manifest_path.stat().st_mtime))
+        return outputs
+
+    ##Store outputs under a key, written to a temporary directory first so readers never see a partial entry
+    def save(self, key, outputs, stage_name=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = self.directory / '.{}.{}.tmp'.format(key, uuid.uuid4().hex)
+        temp_path.mkdir()
+        formats = {name: _write_value(temp_path, name, value) for name, value in outputs.items()}
+        with open(temp_path / 'manifest.json', 'w') as file:
+            json.dump({'stage': stage_name, 'created': time.time(), 'outputs': formats}, file)
+        try:
+            os.replace(temp_path, self.entry_path(key))
+        except OSError:
+            ##Another run stored the same key first
+            shutil.rmtree(temp_path, ignore_errors=True)
+        self.evict()
+
+    ##Remove the least recently used entries until the store is under its size budget
+    def evict(self):
+        with self._lock:
+            entries = []
+            for path in self.directory.glob('*/manifest.json'):
+                try:
+                    size = sum(file.stat().st_size for file in path.parent.iterdir())
+                    entries.append((path.stat().st_atime, size, path.parent))
+                except FileNotFoundError:
+                    continue
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total_bytes -= size
+
+    ##Remove every entry
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,45 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# MODULE ACTIVITY
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import numpy
+
+##Staging table activity flags applied locally to the student by module extract
+MODULE_ACTIVITY_FLAGS = ['is_discussion_forum', 'is_class_wide_hyphenated']
+FORUM_ACTIVITY_FLAGS = ['is_forum']
+
+################################################################################################################################################################
+#2.) FILTERS
+
+##Boolean mask of rows where any of the activity flags is set
+def activity_mask(df, flags):
+    mask = numpy.zeros(len(df), dtype=bool)
+    for flag in flags:
+        mask |= df[flag].to_numpy(dtype=bool, na_value=False)
+    return mask
+
+################################################################################################################################################################
+#3.) AGGREGATIONS
+
+##Student level rows: posts summed over activities for each combination of keys
+##Missing keys form their own group, as they do in a SQL GROUP BY
+def student_level(df, keys, mask):
+    return (df[mask].groupby(keys, sort=False, observed=True, dropna=False)['number_of_posts']
+                    .sum(min_count=1)
+                    .reset_index())
+
+##Module level rows: grade averaged over the underlying activity rows and posts summed
+def module_level(df, keys, mask):
+    df = df[mask].assign(weighted_grade=lambda frame: frame['module_grade'] * frame['number_of_rows'])
+    df_grouped = df.groupby(keys, sort=False, observed=True, dropna=False).agg(weighted_grade=('weighted_grade', 'sum'),
+                                                                               number_of_rows=('number_of_rows', 'sum'),
+                                                                               number_of_posts=('number_of_posts', 'sum'),
+                                                                               posts_count=('number_of_posts', 'count'))
+    df_grouped['average_grade'] = (df_grouped['weighted_grade'] / df_grouped['number_of_rows']).round(2)
+    df_grouped['number_of_posts'] = df_grouped['number_of_posts'].where(df_grouped['posts_count'] > 0)
+    return df_grouped[['average_grade', 'number_of_posts']].reset_index()
@@ -0,0 +1,244 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# PIPELINE
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import concurrent.futures
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import timeit
+import numpy
+import pandas
+
+##Scheduler settings
+MAX_WORKERS = min(8, os.cpu_count())
+
+##Part of every stage key, bump it to invalidate every stored output, e.g. after a library upgrade changes results
+MEMO_VERSION = 1
+
+##Global values hashed into a stage's code version when a stage reads them
+DATA_TYPES = (str, bytes, int, float, bool, type(None), tuple, list, dict, set, frozenset, numpy.ndarray, pandas.DataFrame, pandas.Series)
+
+################################################################################################################################################################
+#2.) FINGERPRINTS
+
+##Hash of a value's contents: frames are hashed row by row with pandas, arrays by their bytes, anything else pickled
+def fingerprint(value):
+    digest = hashlib.sha256()
+    if isinstance(value, (pandas.DataFrame, pandas.Series)):
+        digest.update(pandas.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        digest.update(repr(value.dtypes.to_dict() if isinstance(value, pandas.DataFrame) else value.dtype).encode('utf-8'))
+        digest.update(repr(list(value.columns) if isinstance(value, pandas.DataFrame) else value.name).encode('utf-8'))
+    elif isinstance(value, numpy.ndarray):
+        digest.update(numpy.ascontiguousarray(value).tobytes())
+        digest.update(repr((value.dtype, value.shape)).encode('utf-8'))
+    else:
+        digest.update(pickle.dumps(value))
+    return digest.hexdigest()
+
+##Source of a function, or its compiled code when the source is not available
+def _function_code(function):
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return repr((function.__code__.co_code, function.__code__.co_consts, function.__code__.co_names))
+
+##Global names read by a code object and the functions, lambdas and comprehensions nested in it
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _global_names(const)
+    return names
+
+##Whether a module is one of the scripts next to the stage's own module, rather than an installed library
+def _is_local(module, directory):
+    path = getattr(module, '__file__', None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == directory
+
+##Source of a local module and of the local modules it imports
+def _module_parts(module, directory, seen):
+    if module.__name__ in seen:
+        return []
+    seen.add(module.__name__)
+    with open(module.__file__, 'rb') as file:
+        parts = [module.__name__, hashlib.sha256(file.read()).hexdigest()]
+    for name, value in sorted(vars(module).items()):
+        if inspect.ismodule(value) and _is_local(value, directory):
+            parts.extend(_module_parts(value, directory, seen))
+    return parts
+
+##Code of a function and of everything it reads from its globals: local modules, local functions and data values
+def _function_parts(function, directory, seen):
+    if id(function) in seen:
+        return []
+    seen.add(id(function))
+    parts = [_function_code(function)]
+    for name in sorted(_global_names(function.__code__)):
+        if name not in function.__globals__:
+            continue
+        value = function.__globals__[name]
+        if inspect.ismodule(value):
+            if _is_local(value, directory):
+                parts.extend(_module_parts(value, directory, seen))
+        elif inspect.isfunction(value):
+            if _is_local(inspect.getmodule(value), directory):
+                parts.extend(_function_parts(value, directory, seen))
+        elif inspect.isclass(value):
+            if _is_local(inspect.getmodule(value), directory):
+                parts.extend(_module_parts(inspect.getmodule(value), directory, seen))
+        elif isinstance(value, DATA_TYPES):
+            try:
+                parts.append(name + '=' + fingerprint(value))
+            except Exception:
+                parts.append(name + '=' + repr(value))
+    return parts
+
+##Version of a function's code: its source, the source of the local modules and functions it calls and the global values it reads
+##A change to a helper module (e.g. grouped_correlation) or to a setting the function reads gives a new version
+def code_version(function):
+    module = inspect.getmodule(function)
+    directory = os.path.dirname(os.path.abspath(module.__file__)) if getattr(module, '__file__', None) else None
+    parts = [str(MEMO_VERSION)] + _function_parts(function, directory, set())
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+##Hash of a list of strings, used to combine a stage's code version with its input fingerprints
+def combine(parts):
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+################################################################################################################################################################
+#3.) STAGES
+
+##A named step with the values it reads and the values it produces
+##The function is called with the inputs as keyword arguments and returns the single output, or a tuple in output order
+##Stages with memoize=False, like extractions, always run: their result depends on the warehouse, not on their inputs
+##Stages with side effects, like figure and csv exports, are also memoize=False, a memo hit only restores returned values
+class Stage:
+
+    def __init__(self, name, function, inputs=(), outputs=(), memoize=True):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.memoize = memoize
+
+    ##Read when the stage runs rather than when it is registered, so globals defined or changed later in the script are included
+    @property
+    def version(self):
+        return code_version(self.function)
+
+    def __call__(self, values):
+        result = self.function(**{name: values[name] for name in self.inputs})
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        return dict(zip(self.outputs, result if result is not None else ()))
+
+################################################################################################################################################################
+#4.) SCHEDULER
+
+##Stages wired together by the names of their inputs and outputs, run in dependency order
+##Independent stages run concurrently on a thread pool, the extractions overlap their warehouse queries this way
+##With a memo store (see memo_store) memoized outputs are also kept on disk by stage key and reused by later runs
+class Pipeline:
+
+    def __init__(self, memo_store=None):
+        self.memo_store = memo_store
+        self.stages = {}
+        self.producers = {}
+        self.values = {}
+        self.fingerprints = {}
+        self.stage_keys = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    ##Register a function as a stage, used as a decorator
+    def stage(self, inputs=(), outputs=(), name=None, memoize=True):
+        def register(function):
+            stage = Stage(name or function.__name__, function, inputs, outputs, memoize)
+            if stage.name in self.stages:
+                raise ValueError('Duplicate stage: {}'.format(stage.name))
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError('{} is produced by both {} and {}'.format(output, self.producers[output], stage.name))
+                self.producers[output] = stage.name
+            self.stages[stage.name] = stage
+            return function
+        return register
+
+    ##Names of the stages a stage reads from
+    def dependencies(self, name):
+        missing = [value for value in self.stages[name].inputs if value not in self.producers]
+        if missing:
+            raise ValueError('No stage produces {} for {}'.format(', '.join(missing), name))
+        return {self.producers[value] for value in self.stages[name].inputs}
+
+    ##The given stages and everything upstream of them
+    def upstream(self, names):
+        selected = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError('Unknown stage: {}'.format(name))
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.dependencies(name))
+        return selected
+
+    ##Key of a stage run: its code version and the fingerprints of its inputs
+    def stage_key(self, stage):
+        return combine([stage.version] + [self.fingerprints[value] for value in stage.inputs])
+
+    ##Run one stage, or reuse its outputs when its code and inputs are unchanged since an earlier run of this pipeline object
+    ##(e.g. a second run() in the same session) or when they are in the memo store
+    def run_stage(self, name):
+        stage = self.stages[name]
+        key = self.stage_key(stage)
+        if stage.memoize and self.stage_keys.get(name) == key and all(output in self.values for output in stage.outputs):
+            print('Skipped {}: inputs unchanged'.format(name))
+            return
+        start = timeit.default_timer()
+        outputs = self.memo_store.load(key) if stage.memoize and self.memo_store is not None else None
+        if outputs is not None:
+            print('Loaded {} from memo store'.format(name))
+        else:
+            outputs = stage(self.values)
+            if stage.memoize and self.memo_store is not None:
+                self.memo_store.save(key, outputs, name)
+        ##Memoized outputs are identified by the key that produced them, the others by their contents
+        fingerprints = {output: combine([key, output]) if stage.memoize else fingerprint(value) for output, value in outputs.items()}
+        with self._lock:
+            self.values.update(outputs)
+            self.fingerprints.update(fingerprints)
+            self.stage_keys[name] = key
+            self.timings[name] = timeit.default_timer() - start
+        print('Finished {} in {:.2f}s'.format(name, self.timings[name]))
+
+    ##Run the target stages and their upstream stages, or every stage when no targets are given
+    def run(self, targets=None, max_workers=MAX_WORKERS):
+        selected = self.upstream(targets if targets is not None else self.stages)
+        waiting = {name: self.dependencies(name) & selected for name in selected}
+        start = timeit.default_timer()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            while waiting or running:
+                for name in [name for name, dependencies in waiting.items() if not dependencies]:
+                    del waiting[name]
+                    running[executor.submit(self.run_stage, name)] = name
+                if not running:
+                    raise ValueError('Cycle between stages: {}'.format(', '.join(sorted(waiting))))
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    future.result()
+                    for dependencies in waiting.values():
+                        dependencies.discard(name)
+        print('Pipeline time: {:.2f}s'.format(timeit.default_timer() - start))
+        return self.values
@@ -0,0 +1,245 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# RDW CONNECTION
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import atexit
+import contextlib
+import configparser
+import itertools
+import pathlib
+import queue
+import threading
+import timeit
+import numpy
+import pandas
+import psycopg2.pool
+
+##Connect config file
+config = configparser.ConfigParser()
+config_file = str(pathlib.Path.home())+'/config.ini'
+config.read(config_file)
+
+##Pool settings
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 4
+
+##Streaming settings
+CHUNK_SIZE = 50000
+PREFETCH_CHUNKS = 2
+
+##Postgres type codes that are loaded into typed numpy arrays rather than objects
+INTEGER_TYPE_CODES = {20, 21, 23}
+FLOAT_TYPE_CODES = {700, 701, 1700}
+BOOLEAN_TYPE_CODES = {16}
+
+##TCP keep-alive settings so idle pooled sessions are not dropped by the warehouse
+KEEPALIVE_SETTINGS = {'keepalives': 1,
+                      'keepalives_idle': 30,
+                      'keepalives_interval': 10,
+                      'keepalives_count': 5}
+
+################################################################################################################################################################
+#2.) CONNECTION POOL
+
+_pool = None
+_pool_lock = threading.Lock()
+
+##The pool raises PoolError when every connection is out, so callers wait here for a free connection instead
+_connection_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+##Timings of every query run through this module as (name, seconds)
+query_timings = []
+
+##Return the shared pool, opening it on first use
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(MIN_CONNECTIONS,
+                                                             MAX_CONNECTIONS,
+                                                             user=config['USER_LA']['RDW_PROD'],
+                                                             password=config['PWD_LA']['RDW_PROD'],
+                                                             host=config['HOST']['RDW_STAG'],
+                                                             database='rdw',
+                                                             **KEEPALIVE_SETTINGS)
+    return _pool
+
+##Close every pooled connection, called automatically on exit
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+atexit.register(close_pool)
+
+##Borrow a connection from the pool, waiting while all of them are in use, and hand it back afterwards
+@contextlib.contextmanager
+def connection():
+    pool = get_pool()
+    with _connection_slots:
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+################################################################################################################################################################
+#3.) QUERIES
+
+##Record and print the time taken by a query
+def _log_timing(name, start):
+    elapsed = timeit.default_timer() - start
+    query_timings.append((name, elapsed))
+    print('Query time ({}): {:.2f}s'.format(name, elapsed))
+
+##Print the time of every query run so far, slowest first, and the total
+def report_timings():
+    for name, elapsed in sorted(query_timings, key=lambda timing: -timing[1]):
+        print('{:<40} {:>8.2f}s'.format(name, elapsed))
+    print('{:<40} {:>8.2f}s'.format('Total query time', sum(elapsed for _, elapsed in query_timings)))
+
+##Run a query on a pooled connection and return a pandas dataframe
+def read_sql(sql, params=None, name='query'):
+    start = timeit.default_timer()
+    with connection() as conn:
+        df = pandas.read_sql_query(sql, conn, params=params)
+    _log_timing(name, start)
+    return df
+
+##Run a statement that returns no rows (DDL, inserts)
+def execute(sql, params=None, name='statement'):
+    start = timeit.default_timer()
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+    _log_timing(name, start)
+
+################################################################################################################################################################
+#4.) STREAMING EXTRACTION
+
+_cursor_names = itertools.count()
+
+##Growable column array, preallocated to a capacity and doubled when full
+##Integer and boolean columns keep their dtype when NULLs arrive, a mask of the missing rows is kept alongside
+##and the column comes out as a nullable Int64/boolean array, so large ids never pass through float64
+class ColumnBuffer:
+
+    def __init__(self, dtype, capacity):
+        self.data = numpy.empty(capacity, dtype=dtype)
+        self.mask = None
+        self.size = 0
+
+    ##Copy of an array with room for at least size values
+    def _grow(self, array, size):
+        grown = numpy.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+        grown[:self.size] = array[:self.size]
+        return grown
+
+    def append(self, values):
+        end = self.size + len(values)
+        if end > len(self.data):
+            self.data = self._grow(self.data, end)
+            if self.mask is not None:
+                self.mask = self._grow(self.mask, end)
+        if self.data.dtype.kind in 'iub':
+            missing = [value is None for value in values]
+            if any(missing):
+                if self.mask is None:
+                    self.mask = numpy.zeros(len(self.data), dtype=numpy.bool_)
+                self.mask[self.size:end] = missing
+                values = [0 if value is None else value for value in values]
+        elif self.data.dtype.kind == 'f':
+            values = [numpy.nan if value is None else value for value in values]
+        self.data[self.size:end] = values
+        self.size = end
+
+    def values(self):
+        data = self.data[:self.size]
+        if self.mask is None:
+            return data
+        if data.dtype.kind == 'b':
+            return pandas.arrays.BooleanArray(data, self.mask[:self.size])
+        return pandas.arrays.IntegerArray(data, self.mask[:self.size])
+
+##Map a cursor column type code to the numpy dtype it is loaded into
+def _column_dtype(type_code):
+    if type_code in INTEGER_TYPE_CODES:
+        return numpy.int64
+    if type_code in FLOAT_TYPE_CODES:
+        return numpy.float64
+    if type_code in BOOLEAN_TYPE_CODES:
+        return numpy.bool_
+    return object
+
+##Put an item on the chunk queue, giving up when the consumer has stopped reading
+def _put(chunks, item, stop):
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+##Fetch chunks from a server-side cursor on a background thread so the next chunk arrives while the last is processed
+##Stops as soon as stop is set, so a failing consumer never leaves the thread blocked on a full queue
+def _fetch_chunks(cursor, chunks, chunk_size, stop):
+    try:
+        while not stop.is_set():
+            rows = cursor.fetchmany(chunk_size)
+            if not _put(chunks, rows, stop) or not rows:
+                break
+    except Exception as error:
+        _put(chunks, error, stop)
+
+##Run a query through a named server-side cursor and build a pandas dataframe chunk by chunk
+##dtypes maps column names to the numpy dtype their buffer is preallocated with, instead of the one implied by the column type
+def read_sql_streaming(sql, params=None, name='query', chunk_size=CHUNK_SIZE, dtypes=None):
+    start = timeit.default_timer()
+    with connection() as conn:
+        with conn.cursor(name='stream_{}'.format(next(_cursor_names))) as cursor:
+            cursor.itersize = chunk_size
+            ##A trailing semicolon is not allowed inside DECLARE CURSOR
+            cursor.execute(sql.strip().rstrip(';'), params)
+            chunks = queue.Queue(maxsize=PREFETCH_CHUNKS)
+            stop = threading.Event()
+            fetcher = threading.Thread(target=_fetch_chunks, args=(cursor, chunks, chunk_size, stop), daemon=True)
+            fetcher.start()
+            buffers = None
+            try:
+                while True:
+                    rows = chunks.get()
+                    if isinstance(rows, Exception):
+                        raise rows
+                    if buffers is None:
+                        columns = [column.name for column in cursor.description]
+                        buffers = [ColumnBuffer((dtypes or {}).get(column.name, _column_dtype(column.type_code)), chunk_size)
+                                   for column in cursor.description]
+                    if not rows:
+                        break
+                    for buffer, values in zip(buffers, zip(*rows)):
+                        buffer.append(values)
+            finally:
+                ##Stop the fetcher and wait for it before the cursor is closed and the connection goes back to the pool
+                stop.set()
+                while fetcher.is_alive():
+                    try:
+                        chunks.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                fetcher.join()
+    df = pandas.DataFrame({column: buffer.values() for column, buffer in zip(columns, buffers)})
+    _log_timing(name, start)
+    return df
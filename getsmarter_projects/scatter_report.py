@@ -0,0 +1,133 @@
+################################################################################################################################################################
+
+# GJ DE SWARDT
+# SCATTER REPORT
+
+################################################################################################################################################################
+#1.) SETUP
+
+##Import libraries
+import pathlib
+import re
+import numpy
+import plotly.express
+import plotly.graph_objects
+import figure_export
+import grouped_correlation
+
+##Default axis labels
+LABELS = {'number_of_posts': 'Number of Posts',
+          'final_mark': 'Final Mark',
+          'student_name': 'Student Name',
+          'course_abbreviation': 'Course Abbreviation'}
+
+##Large data mode settings
+LARGE_DATA_ROWS = 20000
+DENSITY_BINS = 100
+SAMPLE_SIZE = 5000
+
+################################################################################################################################################################
+#2.) GROUP SLICES
+
+##Sort the dataframe by key once and return it with the start and end row of every group
+def group_slices(df, key):
+    df_sorted = df[df[key].notnull()].sort_values(by=key, kind='mergesort')
+    values = df_sorted[key].to_numpy()
+    if len(values) == 0:
+        return df_sorted, {}
+    starts = numpy.concatenate([[0], numpy.flatnonzero(values[1:] != values[:-1]) + 1])
+    ends = numpy.append(starts[1:], len(values))
+    return df_sorted, {values[start]: (start, end) for start, end in zip(starts, ends)}
+
+##File name for a group, e.g. GWU-SCO becomes fig_gwu_sco.png
+def figure_file_name(group, prefix='fig_'):
+    return prefix + re.sub('[^0-9a-z]+', '_', str(group).lower()).strip('_') + '.png'
+
+################################################################################################################################################################
+#3.) REPORT
+
+##Build a scatter with an OLS trendline for every group of key and queue it for export
+##groups limits the report to the given groups, top_n to the best groups of df_corr by r_squared
+##file_name maps a group to the name of its image, figure_file_name by default
+def scatter_report(df, key, output_dir, x='final_mark', y='number_of_posts', groups=None, df_corr=None, top_n=None,
+                   title='{}: Number of Posts by Final Grade', hover_data=None, labels=LABELS, axis_range=None,
+                   file_name=figure_file_name):
+    df_sorted, slices = group_slices(df, key)
+    if top_n is not None:
+        df_ranked = df_corr[df_corr['r_squared'].notnull()].sort_values(by='r_squared', ascending=False, kind='mergesort')
+        groups = df_ranked.head(top_n)[key].tolist()
+    if groups is None:
+        groups = list(slices)
+    figures = {}
+    for group in groups:
+        if group not in slices:
+            print('No rows for {}: {}'.format(key, group))
+            continue
+        start, end = slices[group]
+        df_group = df_sorted.iloc[start:end]
+        fig = plotly.express.scatter(data_frame=df_group,
+                                     x=x,
+                                     y=y,
+                                     title=title.format(group),
+                                     trendline='ols',
+                                     trendline_color_override='red',
+                                     hover_data=hover_data,
+                                     labels=labels)
+        if axis_range is not None:
+            fig.update_xaxes(range=axis_range)
+            fig.update_yaxes(range=axis_range)
+        figure_export.write_image(fig, str(pathlib.Path(output_dir) / file_name(group)))
+        figures[group] = fig
+    print('Queued {} {} figures'.format(len(figures), key))
+    return figures
+
+################################################################################################################################################################
+#4.) LARGE DATA MODE
+
+##Exact OLS trendline and r over all rows from the Pearson sufficient statistics
+def ols_trendline(x, y):
+    sums = grouped_correlation.pearson_sums(numpy.zeros(len(x), dtype=numpy.int64), x, y, 1)
+    sums = {name: value[0] for name, value in sums.items()}
+    slope = (sums['n'] * sums['sum_xy'] - sums['sum_x'] * sums['sum_y']) / (sums['n'] * sums['sum_xx'] - sums['sum_x'] ** 2)
+    r, _ = grouped_correlation.pearson_from_sums(**sums)
+    x_values = numpy.asarray(x, dtype=numpy.float64)
+    y_values = numpy.asarray(y, dtype=numpy.float64)
+    valid = ~numpy.isnan(x_values) & ~numpy.isnan(y_values)
+    intercept = y_values[valid].mean() - slope * x_values[valid].mean()
+    return slope, intercept, float(r)
+
+##Scatter that stays the same size however many rows there are
+##mode='density' bins all points into a 2D grid, mode='sample' plots a uniform random sample
+##The red trendline is always fitted on every row
+def large_scatter(df, x, y, title, mode='density', bins=DENSITY_BINS, sample_size=SAMPLE_SIZE, hover_data=None,
+                  labels=LABELS, axis_range=None, random_state=23):
+    x_values = df[x].to_numpy(dtype=numpy.float64)
+    y_values = df[y].to_numpy(dtype=numpy.float64)
+    slope, intercept, r = ols_trendline(x_values, y_values)
+    valid = ~numpy.isnan(x_values) & ~numpy.isnan(y_values)
+    if mode == 'density':
+        bin_range = [axis_range, axis_range] if axis_range is not None else None
+        counts, x_edges, y_edges = numpy.histogram2d(x_values[valid], y_values[valid], bins=bins, range=bin_range)
+        fig = plotly.graph_objects.Figure(plotly.graph_objects.Heatmap(x=(x_edges[:-1] + x_edges[1:]) / 2,
+                                                                       y=(y_edges[:-1] + y_edges[1:]) / 2,
+                                                                       z=numpy.where(counts.T > 0, counts.T, numpy.nan),
+                                                                       colorscale='Blues',
+                                                                       colorbar={'title': 'Students'}))
+        fig.update_layout(xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y))
+    else:
+        rows = numpy.flatnonzero(valid)
+        if len(rows) > sample_size:
+            rows = numpy.sort(numpy.random.default_rng(random_state).choice(rows, sample_size, replace=False))
+        fig = plotly.express.scatter(data_frame=df.iloc[rows], x=x, y=y, hover_data=hover_data, labels=labels)
+        fig.update_traces(marker=dict(size=5))
+    x_line = numpy.array(axis_range if axis_range is not None else [numpy.nanmin(x_values), numpy.nanmax(x_values)], dtype=numpy.float64)
+    fig.add_trace(plotly.graph_objects.Scatter(x=x_line,
+                                               y=intercept + slope * x_line,
+                                               mode='lines',
+                                               line={'color': 'red'},
+                                               name='OLS trendline (R-squared {:.3f})'.format(r ** 2)))
+    fig.update_layout(title='{} (n = {:,})'.format(title, int(valid.sum())))
+    if axis_range is not None:
+        fig.update_xaxes(range=axis_range)
+        fig.update_yaxes(range=axis_range)
+    return fig